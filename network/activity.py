@@ -0,0 +1,207 @@
+"""Activity log and collapsed notifications.
+
+Likes, follows and comments append events to ActivityOutbox in the transaction
+of the action. drain_outbox moves them into the Activity log in batches and
+folds them into one Notification per recipient, kind and post.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+
+from network.models import Activity, ActivityOutbox, Notification, Post, Verb
+
+# event verb -> (verb of the notification, change of its actors_count)
+NOTIFIED_VERBS = {
+    Verb.LIKE: (Verb.LIKE, 1),
+    Verb.UNLIKE: (Verb.LIKE, -1),
+    Verb.FOLLOW: (Verb.FOLLOW, 1),
+    Verb.UNFOLLOW: (Verb.FOLLOW, -1),
+    Verb.COMMENT: (Verb.COMMENT, 1),
+}
+# verb of a notification -> verb of events undoing it
+UNDO_VERBS = {
+    verb: event_verb
+    for event_verb, (verb, delta) in NOTIFIED_VERBS.items()
+    if delta < 0
+}
+
+
+def record(verb, events):
+    """Appends (actor_id, recipient_id, post_id) events to the outbox"""
+    ActivityOutbox.objects.bulk_create(
+        ActivityOutbox(
+            verb=verb, actor_id=actor_id, recipient_id=recipient_id, post_id=post_id
+        )
+        for actor_id, recipient_id, post_id in events
+    )
+
+
+def _notify(recipient_id, verb, post_id, delta, last_actor_id, updated_at):
+    notifications = Notification.objects.filter(
+        recipient_id=recipient_id, verb=verb, post_id=post_id
+    )
+    changes = {"actors_count": F("actors_count") + delta}
+    if last_actor_id is not None:
+        changes.update(last_actor_id=last_actor_id, updated_at=updated_at)
+    if notifications.update(**changes) or last_actor_id is None:
+        return
+    try:
+        with transaction.atomic():
+            Notification.objects.create(
+                recipient_id=recipient_id,
+                verb=verb,
+                post_id=post_id,
+                last_actor_id=last_actor_id,
+                actors_count=delta,
+                updated_at=updated_at,
+            )
+    except IntegrityError:
+        # created by a concurrent drain
+        notifications.update(**changes)
+
+
+def _reset_last_actor(recipient_id, verb, post_id, undone_actor_ids):
+    """Points a notification whose last actor undid the action to the most
+    recent actor who didn't, or to nobody. Runs after events are added to the
+    activity log."""
+    activities = Activity.objects.filter(recipient_id=recipient_id, post_id=post_id)
+    undone = activities.filter(
+        verb=UNDO_VERBS[verb],
+        actor_id=OuterRef("actor_id"),
+        created_at__gte=OuterRef("created_at"),
+    )
+    remaining = (
+        activities.filter(verb=verb)
+        .exclude(actor_id=recipient_id)
+        .exclude(Exists(undone))
+        .order_by("-created_at", "-id")
+        .values("actor_id")[:1]
+    )
+    Notification.objects.filter(
+        recipient_id=recipient_id,
+        verb=verb,
+        post_id=post_id,
+        last_actor_id__in=undone_actor_ids,
+    ).update(last_actor_id=Subquery(remaining))
+
+
+def _collapse(events):
+    """Folds events into notifications, one update per notification.
+
+    Comments count distinct commenters: an actor who commented on the post in
+    this batch or before is counted once. Runs before events are added to the
+    activity log. Returns (recipient, verb, post, actors) of notifications whose
+    actors undid the action, for _reset_last_actor.
+    """
+    groups = {}
+    for event in events:
+        if event.actor_id == event.recipient_id:
+            continue
+        verb, delta = NOTIFIED_VERBS[event.verb]
+        group = groups.setdefault(
+            (event.recipient_id, verb, event.post_id),
+            {
+                "delta": 0,
+                "last_actor_id": None,
+                "updated_at": None,
+                "actors": set(),
+                "undone": set(),
+            },
+        )
+        group["delta"] += delta
+        group["actors"].add(event.actor_id)
+        if delta > 0:
+            group["last_actor_id"] = event.actor_id
+            group["updated_at"] = event.created_at
+            group["undone"].discard(event.actor_id)
+        else:
+            group["undone"].add(event.actor_id)
+
+    comments = {
+        post_id: group
+        for (_, verb, post_id), group in groups.items()
+        if verb == Verb.COMMENT
+    }
+    if comments:
+        commented = set(
+            Activity.objects.filter(
+                verb=Verb.COMMENT,
+                post_id__in=comments,
+                actor_id__in=set().union(
+                    *(group["actors"] for group in comments.values())
+                ),
+            ).values_list("post_id", "actor_id")
+        )
+        for post_id, group in comments.items():
+            group["delta"] = len(
+                {
+                    actor
+                    for actor in group["actors"]
+                    if (post_id, actor) not in commented
+                }
+            )
+
+    # the same order in every drain, so concurrent drains don't deadlock
+    undone = []
+    for (recipient_id, verb, post_id), group in sorted(groups.items()):
+        del group["actors"]
+        if group["undone"]:
+            undone.append((recipient_id, verb, post_id, group["undone"]))
+        del group["undone"]
+        _notify(recipient_id, verb, post_id, **group)
+    return undone
+
+
+def drain_outbox():
+    """Moves a batch of outbox events to the activity log and notifications.
+
+    Rows are claimed with SKIP LOCKED, so drains can run concurrently. Returns
+    the amount of drained events.
+    """
+    with transaction.atomic():
+        claimed = list(
+            ActivityOutbox.objects.select_for_update(skip_locked=True).order_by("id")[
+                : settings.ACTIVITY_OUTBOX_BATCH_SIZE
+            ]
+        )
+        if not claimed:
+            return 0
+
+        # events of posts and users deleted in the meantime are dropped
+        post_ids = set(
+            Post.objects.filter(
+                id__in={event.post_id for event in claimed if event.post_id}
+            ).values_list("id", flat=True)
+        )
+        user_ids = set(
+            get_user_model()
+            .objects.filter(
+                id__in={event.actor_id for event in claimed}
+                | {event.recipient_id for event in claimed}
+            )
+            .values_list("id", flat=True)
+        )
+        events = [
+            event
+            for event in claimed
+            if event.actor_id in user_ids
+            and event.recipient_id in user_ids
+            and (event.post_id is None or event.post_id in post_ids)
+        ]
+
+        undone = _collapse(events)
+        Activity.objects.bulk_create(
+            Activity(
+                verb=event.verb,
+                actor_id=event.actor_id,
+                recipient_id=event.recipient_id,
+                post_id=event.post_id,
+                created_at=event.created_at,
+            )
+            for event in events
+        )
+        for recipient_id, verb, post_id, actor_ids in undone:
+            _reset_last_actor(recipient_id, verb, post_id, actor_ids)
+        ActivityOutbox.objects.filter(id__in=[event.id for event in claimed]).delete()
+    return len(claimed)
@@ -0,0 +1,139 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import Http404
+from django.views import View
+from rest_framework.response import Response
+
+from network import cache
+from network.serializers import PostDetailSerializer
+from network.views import PostViewSet
+from social_media.db_pool import query_executor, track_busy
+
+
+@track_busy
+def _evaluate(queryset):
+    """Evaluates queryset on a worker thread, with the connection of the thread"""
+    close_old_connections()
+    try:
+        return list(queryset)
+    finally:
+        close_old_connections()
+
+
+async def gather_querysets(*querysets):
+    """Evaluates independent querysets concurrently.
+
+    The async ORM of Django 4.2 runs every query of a request on one thread, one
+    after another, so each queryset gets a worker thread and connection instead.
+    Workers are shared by the process and bounded by DB_QUERY_WORKERS.
+    """
+    return await asyncio.gather(
+        *(
+            sync_to_async(_evaluate, thread_sensitive=False, executor=query_executor)(
+                queryset
+            )
+            for queryset in querysets
+        )
+    )
+
+
+class AsyncPostReadView(View):
+    """Serves a read action of PostViewSet without blocking a worker.
+
+    Authentication, permissions, querysets and serializers come from the viewset,
+    so responses match the sync endpoints. Subclasses build the response in
+    `async respond(viewset, **kwargs)`. Other methods of the same url are handed
+    to fallback_view.
+    """
+
+    action = None
+    fallback_view = None
+    query_budget = PostViewSet.query_budget
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # same as DRF views, SessionAuthentication enforces CSRF by itself
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            return await self.get(request, *args, **kwargs)
+        return await sync_to_async(self.fallback_view)(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        # options of @action, like pagination_class, as the router passes them
+        initkwargs = getattr(getattr(PostViewSet, self.action), "kwargs", {})
+        viewset = PostViewSet(
+            action_map={"get": self.action, "head": self.action},
+            args=args,
+            kwargs=kwargs,
+            format_kwarg=None,
+            **initkwargs,
+        )
+        request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.request = request
+        viewset.headers = viewset.default_response_headers
+        try:
+            await sync_to_async(viewset.initial)(request, *args, **kwargs)
+            response = await self.respond(viewset, **kwargs)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return viewset.finalize_response(request, response, *args, **kwargs)
+
+
+class AsyncPostListView(AsyncPostReadView):
+    """Posts list, following, liked and my posts"""
+
+    async def respond(self, viewset, **kwargs):
+        if self.action == "list":
+            return await cache.acached_response(
+                await sync_to_async(cache.post_list_key)(viewset.request),
+                lambda: self.page(viewset),
+            )
+        if self.action == "see_following_users_posts":
+            # the page of ids and the posts are queried one after another
+            return await sync_to_async(viewset.see_following_users_posts)(
+                viewset.request
+            )
+        return await self.page(viewset)
+
+    @staticmethod
+    async def page(viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        posts = await sync_to_async(viewset.paginate_queryset)(queryset)
+        serializer = viewset.get_serializer(posts, many=True)
+        return viewset.get_paginated_response(serializer.data)
+
+
+class AsyncPostDetailView(AsyncPostReadView):
+    """Post detail, the post and its relation previews are loaded concurrently"""
+
+    action = "retrieve"
+
+    async def respond(self, viewset, pk):
+        return await cache.acached_response(
+            await sync_to_async(cache.post_detail_key)(pk),
+            lambda: self.detail(viewset, pk),
+            # scheduled posts are served to their author only
+            cacheable=lambda response: response.data["is_published"],
+        )
+
+    @staticmethod
+    async def detail(viewset, pk):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        posts, likers, comments = await gather_querysets(
+            queryset.filter(pk=pk),
+            PostDetailSerializer.liked_by_queryset(pk),
+            PostDetailSerializer.comments_queryset(pk),
+        )
+        if not posts:
+            raise Http404
+        post = posts[0]
+        viewset.check_object_permissions(viewset.request, post)
+        post.liked_by_preview = likers
+        post.comments_preview = comments
+        return Response(viewset.get_serializer(post).data)
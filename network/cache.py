@@ -0,0 +1,110 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from social_media.replicas import reading_from_primary
+
+HITS_KEY = "network:cache:hits"
+MISSES_KEY = "network:cache:misses"
+POSTS_VERSION_KEY = "network:posts:version"
+
+
+def _post_version_key(post_id):
+    return f"network:post:{post_id}:version"
+
+
+def _get_version(key):
+    """Current version of a namespace, initialized on first use.
+
+    Versions start from the current time, so a version key evicted from the cache
+    never comes back with a number that older entries were stored under.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def post_detail_key(post_id):
+    version = _get_version(_post_version_key(post_id))
+    return f"network:post:{post_id}:v{version}"
+
+
+def post_list_key(request):
+    """Key of a posts list page, covers filters, page size and cursor"""
+    version = _get_version(POSTS_VERSION_KEY)
+    query = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"network:posts:v{version}:{query}"
+
+
+def invalidate_post(post_id):
+    """Drops cached detail of the post and every cached list page in O(1)"""
+    _bump_version(_post_version_key(post_id))
+    _bump_version(POSTS_VERSION_KEY)
+
+
+def invalidate_post_lists():
+    _bump_version(POSTS_VERSION_KEY)
+
+
+def cached_response(key, build_response, cacheable=None):
+    """Serves response data from cache, builds and stores it on a miss.
+
+    Misses are built from the primary, see reading_from_primary. Successful
+    responses are stored unless cacheable(response) is false.
+    """
+    data = cache.get(key)
+    if data is not None:
+        _count(HITS_KEY)
+        return Response(data)
+
+    _count(MISSES_KEY)
+    with reading_from_primary():
+        response = build_response()
+    if response.status_code == 200 and (cacheable is None or cacheable(response)):
+        cache.set(key, response.data, settings.POSTS_CACHE_TIMEOUT)
+    return response
+
+
+async def acached_response(key, build_response, cacheable=None):
+    """Async variant of cached_response, build_response is a coroutine function"""
+    data = await cache.aget(key)
+    if data is not None:
+        await sync_to_async(_count)(HITS_KEY)
+        return Response(data)
+
+    await sync_to_async(_count)(MISSES_KEY)
+    with reading_from_primary():
+        response = await build_response()
+    if response.status_code == 200 and (cacheable is None or cacheable(response)):
+        await cache.aset(key, response.data, settings.POSTS_CACHE_TIMEOUT)
+    return response
+
+
+def get_stats():
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+    }
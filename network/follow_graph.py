@@ -0,0 +1,159 @@
+"""Redis adjacency cache of the follow graph.
+
+Every user has a set of followed user ids and a set of follower ids. A set is
+loaded from the through table on first use and then kept in step by
+m2m_changed receivers, which only touch sets that are already loaded. Loaded
+sets contain the 0 sentinel, so following nobody is still a cache hit. Sets
+expire after FOLLOW_GRAPH_TTL_SECONDS, which bounds the drift of a load racing
+with a follow toggle. Reads fall back to the database when Redis is unavailable.
+"""
+import itertools
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+SENTINEL = 0
+
+# KEYS - sets; ARGV[1] - SADD or SREM, ARGV[i + 1] - member for KEYS[i]
+UPDATE_LOADED_LUA = """
+for i, key in ipairs(KEYS) do
+    if redis.call("EXISTS", key) == 1 then
+        redis.call(ARGV[1], key, ARGV[i + 1])
+    end
+end
+"""
+
+# edges per script call, so a large update doesn't block Redis for long
+UPDATE_CHUNK_SIZE = 500
+
+_client = None
+_update_loaded = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.FOLLOW_GRAPH_REDIS_URL)
+    return _client
+
+
+def _update_loaded_script():
+    global _update_loaded
+    if _update_loaded is None:
+        _update_loaded = _redis().register_script(UPDATE_LOADED_LUA)
+    return _update_loaded
+
+
+def _following_key(user_id):
+    return f"network:following:{user_id}"
+
+
+def _followers_key(user_id):
+    return f"network:followers:{user_id}"
+
+
+def _follow():
+    return get_user_model().followed_by.through
+
+
+def _members(key, queryset):
+    """Ids in the set under key, loaded from the queryset on a miss"""
+    try:
+        client = _redis()
+        members = client.smembers(key)
+        if members:
+            return {int(member) for member in members} - {SENTINEL}
+        ids = set(queryset)
+        pipe = client.pipeline()
+        pipe.sadd(key, SENTINEL, *ids)
+        pipe.expire(key, settings.FOLLOW_GRAPH_TTL_SECONDS)
+        pipe.execute()
+        return ids
+    except redis.RedisError:
+        return set(queryset)
+
+
+def following_ids(user_id):
+    """Ids of users the user follows"""
+    return _members(
+        _following_key(user_id),
+        _follow()
+        .objects.filter(to_user_id=user_id)
+        .values_list("from_user_id", flat=True),
+    )
+
+
+def follower_ids(user_id):
+    """Ids of users following the user"""
+    return _members(
+        _followers_key(user_id),
+        _follow()
+        .objects.filter(from_user_id=user_id)
+        .values_list("to_user_id", flat=True),
+    )
+
+
+def is_following(follower_id, user_id):
+    key = _following_key(follower_id)
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.sismember(key, user_id)
+        loaded, member = pipe.execute()
+        if loaded:
+            return bool(member)
+    except redis.RedisError:
+        pass
+    return user_id in following_ids(follower_id)
+
+
+def _update(command, edges):
+    edges = iter(edges)
+    while chunk := list(itertools.islice(edges, UPDATE_CHUNK_SIZE)):
+        keys, members = [], []
+        for follower_id, followed_id in chunk:
+            keys += [_following_key(follower_id), _followers_key(followed_id)]
+            members += [followed_id, follower_id]
+        try:
+            _update_loaded_script()(keys=keys, args=[command, *members])
+        except redis.RedisError:
+            # sets that missed the update are stale until they expire
+            pass
+
+
+def add_edges(edges):
+    """Adds (follower id, followed id) pairs to loaded sets"""
+    _update("SADD", edges)
+
+
+def remove_edges(edges):
+    """Removes (follower id, followed id) pairs from loaded sets"""
+    _update("SREM", edges)
+
+
+def forget(*user_ids):
+    """Drops the sets of users, they are reloaded on the next read"""
+    try:
+        _redis().delete(
+            *(
+                key
+                for user_id in user_ids
+                for key in (_following_key(user_id), _followers_key(user_id))
+            )
+        )
+    except redis.RedisError:
+        pass
+
+
+def forget_all():
+    """Drops every cached set, after changes of the through table made in bulk"""
+    client = _redis()
+    keys = []
+    for key in client.scan_iter(match="network:follow*:*", count=1000):
+        keys.append(key)
+        if len(keys) == 1000:
+            client.unlink(*keys)
+            keys = []
+    if keys:
+        client.unlink(*keys)
@@ -0,0 +1,59 @@
+import re
+
+from django.db.models.functions import Lower
+
+from network.models import Hashtag
+
+HASHTAG_RE = re.compile(r"(?<![\w#])#(\w+)")
+
+
+def extract_hashtags(*texts):
+    """Lowercased names of #tags found in the given texts"""
+    return {
+        name.lower()[: Hashtag._meta.get_field("name").max_length]
+        for text in texts
+        if text
+        for name in HASHTAG_RE.findall(text)
+    }
+
+
+def _existing_hashtags(names):
+    """Hashtags of lowercased names, matched case-insensitively, the oldest
+    one of names differing only in case wins"""
+    return dict(
+        Hashtag.objects.annotate(lower_name=Lower("name"))
+        .filter(lower_name__in=names)
+        .order_by("lower_name", "id")
+        .distinct("lower_name")
+        .values_list("lower_name", "id")
+    )
+
+
+def resolve_hashtags(names):
+    """Maps lowercased hashtag names to ids, unknown names are created with one
+    upsert"""
+    if not names:
+        return {}
+    hashtag_ids = _existing_hashtags(names)
+    missing = set(names) - hashtag_ids.keys()
+    if missing:
+        Hashtag.objects.bulk_create(
+            [Hashtag(name=name) for name in missing], ignore_conflicts=True
+        )
+        hashtag_ids.update(_existing_hashtags(missing))
+    return hashtag_ids
+
+
+def attach_extracted_hashtags(post, previous_names=()):
+    """Links the post with hashtags mentioned in its title and content.
+
+    Hashtags only mentioned in the previous text, with names previous_names,
+    are unlinked; hashtags set explicitly stay.
+    """
+    names = extract_hashtags(post.title, post.content)
+    removed = set(previous_names) - names
+    if removed:
+        post.hashtags.remove(*_existing_hashtags(removed).values())
+    hashtag_ids = resolve_hashtags(names)
+    if hashtag_ids:
+        post.hashtags.add(*hashtag_ids.values())
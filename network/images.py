@@ -0,0 +1,107 @@
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+PIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+RENDITION_FORMATS = ("webp", "jpeg")
+# uploads of other formats are stored as PNG
+ORIGINAL_FORMATS = {"JPEG": "jpeg", "WEBP": "webp"}
+# renditions of an older version kept the uploaded original, with its metadata
+VERSION = 2
+
+
+def is_processed(instance):
+    """Whether the image of instance was stripped and has its renditions"""
+    renditions = instance.image_renditions
+    return bool(
+        instance.image
+        and renditions.get("version") == VERSION
+        and renditions.get("source") == instance.image.name
+        and "files" in renditions
+    )
+
+
+def _flatten(image):
+    """Composites transparent areas onto white, JPEG has no alpha channel"""
+    if image.mode != "RGBA":
+        return image
+    flat = Image.new("RGB", image.size, "white")
+    flat.paste(image, mask=image.getchannel("A"))
+    return flat
+
+
+def _encode(image, fmt, quality):
+    """Encodes image without any metadata, so EXIF is never stored"""
+    if fmt == "jpeg":
+        image = _flatten(image)
+    buffer = io.BytesIO()
+    image.save(buffer, PIL_FORMATS[fmt], quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _store(content, folder, fmt):
+    """Stores content under its sha256 digest, identical files are shared"""
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(folder, digest[:2], f"{digest}.{fmt}")
+    if not default_storage.exists(path):
+        path = default_storage.save(path, ContentFile(content))
+    return path
+
+
+def _open(image_field):
+    """Uploaded image upright, without metadata, in RGB or RGBA mode, and the
+    format to store it in"""
+    with image_field.open("rb") as file:
+        uploaded = Image.open(file)
+        fmt = ORIGINAL_FORMATS.get(uploaded.format, "png")
+        has_alpha = "A" in uploaded.getbands() or "transparency" in uploaded.info
+        image = ImageOps.exif_transpose(uploaded)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    image.info = {}
+    return image, fmt
+
+
+def build_renditions(image_field, folder):
+    """Re-encodes an uploaded image without metadata, like EXIF location, and
+    generates resized WebP and JPEG copies.
+
+    Returns the value stored in `image_renditions`, the stripped original
+    replaces the upload as `image`:
+    {"version": 2, "source": <stripped original>,
+     "files": {<format>: {<width>: <path>}}}
+    or {"version": 2, "source": <uploaded name>, "error": <message>} when the
+    upload can't be read as an image.
+    """
+    try:
+        original, original_fmt = _open(image_field)
+    except (OSError, Image.DecompressionBombError) as error:
+        # UnidentifiedImageError and truncated files are OSErrors
+        return {"version": VERSION, "source": image_field.name, "error": str(error)}
+
+    source = _store(
+        _encode(original, original_fmt, settings.IMAGE_ORIGINAL_QUALITY),
+        os.path.join(folder, "originals"),
+        original_fmt,
+    )
+
+    widths = [
+        width for width in settings.IMAGE_RENDITION_WIDTHS if width <= original.width
+    ] or [original.width]
+
+    files = {fmt: {} for fmt in RENDITION_FORMATS}
+    for width in widths:
+        height = round(original.height * width / original.width)
+        resized = original.resize((width, height), Image.LANCZOS)
+        for fmt in RENDITION_FORMATS:
+            files[fmt][str(width)] = _store(
+                _encode(resized, fmt, settings.IMAGE_RENDITION_QUALITY),
+                os.path.join(folder, "renditions"),
+                fmt,
+            )
+
+    return {"version": VERSION, "source": source, "files": files}
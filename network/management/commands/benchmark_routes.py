@@ -0,0 +1,348 @@
+import io
+import logging
+import re
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from network.models import Comment, Hashtag, Post
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def _png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, "PNG")
+    buffer.seek(0)
+    buffer.name = "benchmark.png"
+    return buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure single-client latency percentiles and queries per request of "
+        "every API route against the current database, best filled by "
+        "generate_social_graph. Requests are sent one at a time by an in-process "
+        "client, round-robin over a pool of users so write throttles don't kick in; "
+        "this is not a load test, concurrent throughput is not measured. "
+        "Everything written is rolled back in one transaction, so work deferred to "
+        "on_commit (Celery tasks, cache invalidation) never runs and is not timed. "
+        "Uploaded images stay in MEDIA_ROOT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Measured requests per route"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=10, help="Unmeasured requests per route"
+        )
+        parser.add_argument(
+            "--users", type=int, default=100, help="Size of the requesting users pool"
+        )
+        parser.add_argument(
+            "--prefix",
+            default="graph",
+            help="Email prefix of users to request as, see generate_social_graph",
+        )
+        parser.add_argument(
+            "--routes", nargs="+", help="Measure only routes with these names"
+        )
+
+    def _fixtures(self, options):
+        user_model = get_user_model()
+        users = list(
+            user_model.objects.filter(
+                email__startswith=f"{options['prefix']}-"
+            ).order_by("id")[: options["users"]]
+        )
+        if not users:
+            raise CommandError(
+                f"No users with the {options['prefix']!r} prefix, "
+                "run generate_social_graph first"
+            )
+        # admin only routes are requested by the first user of the pool
+        user_model.objects.filter(id=users[0].id).update(is_staff=True)
+
+        self.tokens = {
+            user.id: str(RefreshToken.for_user(user).access_token) for user in users
+        }
+        self.users = users
+        self.celebrity = user_model.objects.order_by("-followers_count").first()
+        self.post = Post.objects.filter(is_published=True).order_by(
+            "-likes_count"
+        ).first() or Post.objects.create(title="benchmark", user=users[0])
+        self.hashtag = Hashtag.objects.first() or Hashtag.objects.create(
+            name="benchmark"
+        )
+        self.comment = Comment.objects.filter(
+            post=self.post
+        ).first() or Comment.objects.create(
+            post=self.post, user=users[0], content="benchmark"
+        )
+
+    def _own_post(self, user):
+        return Post.objects.create(title="benchmark", content="benchmark", user=user)
+
+    def _routes(self):
+        """name, method and a factory of (path, request kwargs) for every route.
+
+        Factories run before the measured request, so objects they create
+        are not part of the timing.
+        """
+        network, account = "/api/network", "/api/user"
+        post, celebrity, hashtag = self.post, self.celebrity, self.hashtag
+
+        def plain(path, **flags):
+            return lambda index, user: (path, dict(flags))
+
+        def json(path, data):
+            return lambda index, user: (
+                path,
+                {"data": data, "content_type": "application/json"},
+            )
+
+        return [
+            ("users", "get", plain(f"{network}/users/")),
+            ("users search", "get", plain(f"{network}/users/?q=graph")),
+            ("user detail", "get", plain(f"{network}/users/{celebrity.id}/")),
+            (
+                "user update",
+                "patch",
+                lambda index, user: (
+                    f"{network}/users/{user.id}/",
+                    {"data": {"bio": "benchmark"}, "content_type": "application/json"},
+                ),
+            ),
+            (
+                "toggle follow",
+                "post",
+                plain(f"{network}/users/{celebrity.id}/toggle-follow/"),
+            ),
+            ("hashtags", "get", plain(f"{network}/hashtags/")),
+            ("hashtags trending", "get", plain(f"{network}/hashtags/trending/")),
+            ("hashtag detail", "get", plain(f"{network}/hashtags/{hashtag.id}/")),
+            ("posts", "get", plain(f"{network}/posts/")),
+            (
+                "posts by hashtag",
+                "get",
+                plain(f"{network}/posts/?hashtags={hashtag.id}"),
+            ),
+            ("posts search", "get", plain(f"{network}/posts/?q=django")),
+            ("posts following", "get", plain(f"{network}/posts/following/")),
+            ("posts liked", "get", plain(f"{network}/posts/liked/")),
+            ("posts my", "get", plain(f"{network}/posts/my/")),
+            ("posts for you", "get", plain(f"{network}/posts/for-you/")),
+            ("post detail", "get", plain(f"{network}/posts/{post.id}/")),
+            ("post likers", "get", plain(f"{network}/posts/{post.id}/likers/")),
+            ("post comments", "get", plain(f"{network}/posts/{post.id}/comments/")),
+            (
+                "post create",
+                "post",
+                json(f"{network}/posts/", {"title": "benchmark", "content": "#bench"}),
+            ),
+            (
+                "posts bulk",
+                "post",
+                json(
+                    f"{network}/posts/bulk/",
+                    [
+                        {"title": f"benchmark {i}", "content": "#bench"}
+                        for i in range(10)
+                    ],
+                ),
+            ),
+            (
+                "post update",
+                "patch",
+                lambda index, user: (
+                    f"{network}/posts/{self._own_post(user).id}/",
+                    {"data": {"content": "edited"}, "content_type": "application/json"},
+                ),
+            ),
+            (
+                "post upload image",
+                "post",
+                lambda index, user: (
+                    f"{network}/posts/{self._own_post(user).id}/upload-image/",
+                    {"data": {"image": _png()}},
+                ),
+            ),
+            (
+                "post delete",
+                "delete",
+                lambda index, user: (f"{network}/posts/{self._own_post(user).id}/", {}),
+            ),
+            ("toggle like", "post", plain(f"{network}/posts/{post.id}/toggle-like/")),
+            (
+                "comment create",
+                "post",
+                json(f"{network}/posts/{post.id}/comment/", {"content": "benchmark"}),
+            ),
+            ("comment detail", "get", plain(f"{network}/comments/{self.comment.id}/")),
+            (
+                "comment delete",
+                "delete",
+                lambda index, user: (
+                    f"{network}/comments/"
+                    f"{Comment.objects.create(post=post, user=user, content='x').id}/",
+                    {},
+                ),
+            ),
+            ("notifications", "get", plain(f"{network}/notifications/")),
+            ("cache stats", "get", plain(f"{network}/cache-stats/", admin=True)),
+            ("db stats", "get", plain(f"{network}/db-stats/", admin=True)),
+            (
+                "register",
+                "post",
+                lambda index, user: (
+                    f"{account}/register/",
+                    {
+                        "data": {
+                            "email": f"bench-{uuid.uuid4().hex}@example.com",
+                            "password": "benchmark",
+                        },
+                        "content_type": "application/json",
+                        "anonymous": True,
+                    },
+                ),
+            ),
+            (
+                "token",
+                "post",
+                lambda index, user: (
+                    f"{account}/token/",
+                    {
+                        "data": {"email": user.email, "password": "password"},
+                        "content_type": "application/json",
+                        "anonymous": True,
+                    },
+                ),
+            ),
+            (
+                "token refresh",
+                "post",
+                lambda index, user: (
+                    f"{account}/token/refresh/",
+                    {
+                        "data": {"refresh": str(RefreshToken.for_user(user))},
+                        "content_type": "application/json",
+                        "anonymous": True,
+                    },
+                ),
+            ),
+            ("me", "get", plain(f"{account}/me/")),
+            (
+                "me update",
+                "patch",
+                json(f"{account}/me/", {"bio": "benchmark"}),
+            ),
+            (
+                "me upload image",
+                "post",
+                lambda index, user: (
+                    f"{account}/me/upload-image/",
+                    {"data": {"image": _png()}},
+                ),
+            ),
+            ("me followers", "get", plain(f"{account}/me/followers/")),
+            ("me following", "get", plain(f"{account}/me/following/")),
+            (
+                "logout",
+                "post",
+                lambda index, user: (
+                    f"{account}/logout/",
+                    {
+                        "data": {"refresh": str(RefreshToken.for_user(user))},
+                        "content_type": "application/json",
+                    },
+                ),
+            ),
+        ]
+
+    def _request(self, client, method, factory, index):
+        user = self.users[index % len(self.users)]
+        path, kwargs = factory(index, user)
+        if kwargs.pop("admin", False):
+            user = self.users[0]
+        if not kwargs.pop("anonymous", False):
+            kwargs["HTTP_AUTHORIZATION"] = f"Bearer {self.tokens[user.id]}"
+        # a distinct address per request keeps anonymous ip buckets full
+        kwargs[
+            "REMOTE_ADDR"
+        ] = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+        started = time.perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        match = _QUERIES_RE.search(response.get("Server-Timing", ""))
+        return elapsed, response.status_code, match and int(match.group(1))
+
+    def _measure(self, client, method, factory, options):
+        index = 0
+        for _ in range(options["warmup"]):
+            self._request(client, method, factory, index)
+            index += 1
+
+        timings, statuses, queries = [], set(), []
+        for _ in range(options["requests"]):
+            elapsed, status, amount = self._request(client, method, factory, index)
+            index += 1
+            timings.append(elapsed * 1000)
+            statuses.add(status)
+            if amount is not None:
+                queries.append(amount)
+
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+        return {
+            "p50": percentiles[49],
+            "p95": percentiles[94],
+            "p99": percentiles[98],
+            "mean": statistics.mean(timings),
+            "queries": statistics.mean(queries) if queries else None,
+            "statuses": ",".join(str(status) for status in sorted(statuses)),
+        }
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("At least 2 requests per route are needed")
+        client = Client(SERVER_NAME="localhost")
+
+        self.stdout.write(
+            f"{'route':<20} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+            f"{'queries':>8}  status  (ms, one client)"
+        )
+        # every request logs its queries, those are in the table already
+        logging.disable(logging.WARNING)
+        try:
+            # queries are read from the Server-Timing header, off in production
+            with override_settings(QUERY_SERVER_TIMING=True):
+                self._run(client, options)
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def _run(self, client, options):
+        with transaction.atomic():
+            self._fixtures(options)
+            for name, method, factory in self._routes():
+                if options["routes"] and name not in options["routes"]:
+                    continue
+                result = self._measure(client, method, factory, options)
+                queries = (
+                    "-" if result["queries"] is None else f"{result['queries']:.1f}"
+                )
+                self.stdout.write(
+                    f"{name:<20} {result['mean']:>8.2f} {result['p50']:>8.2f} "
+                    f"{result['p95']:>8.2f} {result['p99']:>8.2f} {queries:>8}  "
+                    f"{result['statuses']}"
+                )
+
+            transaction.set_rollback(True)
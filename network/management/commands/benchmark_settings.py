@@ -0,0 +1,94 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter for every profile, prints measurements as JSON
+PROBE = """
+import json, statistics, sys, time
+
+started = time.perf_counter()
+import django
+
+django.setup()
+from django.test import Client
+from django.urls import get_resolver
+
+get_resolver().url_patterns
+import_ms = (time.perf_counter() - started) * 1000
+
+path, requests = sys.argv[1], int(sys.argv[2])
+client = Client(SERVER_NAME="localhost")
+for _ in range(min(requests, 50)):
+    client.get(path)
+timings = []
+for _ in range(requests):
+    started = time.perf_counter()
+    client.get(path)
+    timings.append((time.perf_counter() - started) * 1000)
+timings.sort()
+print(json.dumps({
+    "import_ms": import_ms,
+    "request_p50_ms": statistics.median(timings),
+    "request_p95_ms": timings[int(len(timings) * 0.95) - 1],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare cold import time and per-request overhead of settings profiles. "
+        "Every profile runs in its own interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profiles",
+            nargs="+",
+            default=["social_media.settings", "social_media.settings_prod"],
+        )
+        parser.add_argument(
+            "--path",
+            default="/api/network/posts/",
+            help="Requested path, anonymous requests to it should not hit the DB",
+        )
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument(
+            "--runs", type=int, default=5, help="Interpreters started per profile"
+        )
+
+    def _probe(self, profile, path, requests):
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": profile,
+            "ALLOWED_HOSTS": "localhost",
+        }
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE, path, str(requests)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profile':<30} {'import':>10} {'req p50':>10} {'req p95':>10}  (ms)"
+        )
+        for profile in options["profiles"]:
+            runs = [
+                self._probe(profile, options["path"], options["requests"])
+                for _ in range(options["runs"])
+            ]
+            medians = {
+                key: statistics.median(run[key] for run in runs) for key in runs[0]
+            }
+            self.stdout.write(
+                f"{profile:<30} {medians['import_ms']:>10.1f} "
+                f"{medians['request_p50_ms']:>10.3f} "
+                f"{medians['request_p95_ms']:>10.3f}"
+            )
@@ -0,0 +1,91 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from network.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure toggle_like and toggle_follow latency while the amount of "
+        "likers and followers grows. All generated data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10, 1_000, 100_000, 1_000_000],
+            help="Amounts of existing likers/followers to measure with",
+        )
+        parser.add_argument(
+            "--repeats",
+            type=int,
+            default=200,
+            help="Toggles measured for every size",
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def _grow(self, post, author, start, stop, batch_size):
+        """Adds users [start, stop) as likers of post and followers of author"""
+        user_model = get_user_model()
+        like = Post.liked_by.through
+        follow = user_model.followed_by.through
+
+        for offset in range(start, stop, batch_size):
+            users = user_model.objects.bulk_create(
+                user_model(email=f"bench-{i}@example.com", password="!")
+                for i in range(offset, min(offset + batch_size, stop))
+            )
+            like.objects.bulk_create(like(post=post, user=user) for user in users)
+            follow.objects.bulk_create(
+                follow(from_user=author, to_user=user) for user in users
+            )
+
+    @staticmethod
+    def _measure(toggle, repeats):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            toggle()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return (
+            statistics.median(timings),
+            timings[int(len(timings) * 0.95) - 1],
+        )
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        repeats = options["repeats"]
+
+        self.stdout.write(
+            f"{'size':>10} {'like p50':>10} {'like p95':>10} "
+            f"{'follow p50':>11} {'follow p95':>11}  (ms)"
+        )
+        with transaction.atomic():
+            author = user_model.objects.create_user("bench-author@example.com")
+            clicker = user_model.objects.create_user("bench-clicker@example.com")
+            post = Post.objects.create(title="benchmark", user=author)
+
+            grown = 0
+            for size in sorted(options["sizes"]):
+                self._grow(post, author, grown, size, options["batch_size"])
+                grown = size
+
+                like_p50, like_p95 = self._measure(
+                    lambda: post.toggle_like(clicker), repeats
+                )
+                follow_p50, follow_p95 = self._measure(
+                    lambda: author.toggle_follow(clicker), repeats
+                )
+                self.stdout.write(
+                    f"{size:>10} {like_p50:>10.3f} {like_p95:>10.3f} "
+                    f"{follow_p50:>11.3f} {follow_p95:>11.3f}"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,214 @@
+import itertools
+import random
+from bisect import bisect
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models.expressions import RawSQL
+
+from network.models import Comment, Hashtag, Post
+
+WORDS = (
+    "django python postgres redis celery feed timeline coffee travel music "
+    "photo weekend release bug deploy football cat dog sunset recipe book"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic social graph for benchmarks. Popularity of users and "
+        "hashtags follows a power law, amounts of follows, posts, likes and "
+        "comments have heavy tails. Generated users have the password 'password'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument(
+            "--follows", type=int, default=30, help="Average follows of a user"
+        )
+        parser.add_argument(
+            "--posts", type=int, default=5, help="Average posts of a user"
+        )
+        parser.add_argument(
+            "--likes", type=int, default=20, help="Average likes of a post"
+        )
+        parser.add_argument(
+            "--comments", type=int, default=3, help="Average comments of a post"
+        )
+        parser.add_argument("--hashtags", type=int, default=500)
+        parser.add_argument(
+            "--exponent",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of popularity, higher is more skewed",
+        )
+        parser.add_argument(
+            "--days", type=int, default=30, help="Posts are spread over that many days"
+        )
+        parser.add_argument(
+            "--prefix", default="graph", help="Prefix of generated emails and hashtags"
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--skip-timelines",
+            action="store_true",
+            help="Don't materialize home timelines, the slowest step on big graphs",
+        )
+
+    def _amount(self, mean, cap):
+        """Heavy-tailed amount with the given mean (Pareto, alpha=2)"""
+        return min(int(mean / 2 * self.random.paretovariate(2)), cap)
+
+    def _zipf_picker(self, population):
+        """Picks from population, the first items being the most popular"""
+        exponent = self.exponent
+        cum_weights = list(
+            itertools.accumulate(
+                1 / rank**exponent for rank in range(1, len(population) + 1)
+            )
+        )
+        total = cum_weights[-1]
+
+        def pick(amount):
+            return {
+                population[bisect(cum_weights, self.random.random() * total)]
+                for _ in range(amount)
+            }
+
+        return pick
+
+    def _insert(self, model, objects, **kwargs):
+        """bulk_create in batches from a generator, returns created objects"""
+        objects = iter(objects)
+        created = []
+        while batch := list(itertools.islice(objects, self.batch_size)):
+            created.extend(model.objects.bulk_create(batch, **kwargs))
+        return created
+
+    def _text(self, words):
+        return " ".join(self.random.choices(WORDS, k=words))
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.exponent = options["exponent"]
+        self.batch_size = options["batch_size"]
+        prefix = options["prefix"]
+        user_model = get_user_model()
+
+        password = make_password("password")
+        users = self._insert(
+            user_model,
+            (
+                user_model(email=f"{prefix}-{index}@example.com", password=password)
+                for index in range(options["users"])
+            ),
+        )
+        user_ids = [user.id for user in users]
+        self.stdout.write(f"Users: {len(user_ids)}")
+
+        # rank of popularity is independent of the id
+        by_popularity = user_ids[:]
+        self.random.shuffle(by_popularity)
+        pick_followed = self._zipf_picker(by_popularity)
+
+        follow = user_model.followed_by.through
+        follows = self._insert(
+            follow,
+            (
+                follow(from_user_id=followed_id, to_user_id=follower_id)
+                for follower_id in user_ids
+                for followed_id in pick_followed(
+                    self._amount(options["follows"], len(user_ids) - 1)
+                )
+                if followed_id != follower_id
+            ),
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f"Follows: {len(follows)}")
+
+        hashtags = self._insert(
+            Hashtag,
+            (Hashtag(name=f"{prefix}{index}") for index in range(options["hashtags"])),
+        )
+        pick_hashtags = self._zipf_picker([hashtag.id for hashtag in hashtags])
+
+        def posts():
+            for author_id in user_ids:
+                for _ in range(self._amount(options["posts"], 1_000)):
+                    yield Post(
+                        title=self._text(4),
+                        content=self._text(30),
+                        user_id=author_id,
+                        hashtag_ids=sorted(pick_hashtags(self.random.randint(0, 3))),
+                    )
+
+        post_hashtag = Post.hashtags.through
+        like = Post.liked_by.through
+        amounts = {"posts": 0, "likes": 0, "comments": 0}
+        posts = iter(posts())
+        while batch := list(itertools.islice(posts, self.batch_size)):
+            batch = Post.objects.bulk_create(batch)
+            self._insert(
+                post_hashtag,
+                (
+                    post_hashtag(post_id=post.id, hashtag_id=hashtag_id)
+                    for post in batch
+                    for hashtag_id in post.hashtag_ids
+                ),
+            )
+            amounts["likes"] += len(
+                self._insert(
+                    like,
+                    (
+                        like(post_id=post.id, user_id=user_id)
+                        for post in batch
+                        for user_id in self.random.sample(
+                            user_ids, self._amount(options["likes"], len(user_ids))
+                        )
+                    ),
+                )
+            )
+            amounts["comments"] += len(
+                self._insert(
+                    Comment,
+                    (
+                        Comment(
+                            post_id=post.id,
+                            user_id=self.random.choice(user_ids),
+                            content=self._text(12),
+                        )
+                        for post in batch
+                        for _ in range(self._amount(options["comments"], 10_000))
+                    ),
+                )
+            )
+            amounts["posts"] += len(batch)
+        self.stdout.write(
+            "Posts: {posts}, likes: {likes}, comments: {comments}".format(**amounts)
+        )
+
+        Post.objects.filter(user_id__in=user_ids).update(
+            created_at=RawSQL(
+                "now() - random() * %s * interval '1 day'", [options["days"]]
+            )
+        )
+        # likes and comments come between publishing and now
+        for model in (like, Comment):
+            table = model._meta.db_table
+            model.objects.filter(post__user_id__in=user_ids).update(
+                created_at=RawSQL(
+                    f"(SELECT created_at + random() * (now() - created_at) "
+                    f"FROM {Post._meta.db_table} WHERE id = {table}.post_id)",
+                    [],
+                )
+            )
+        call_command("rebuild_post_counters", stdout=self.stdout)
+        call_command("rebuild_follow_counters", stdout=self.stdout)
+        call_command("rebuild_post_scores", stdout=self.stdout)
+        if not options["skip_timelines"]:
+            call_command("rebuild_timelines", stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS("Social graph generated"))
@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from network.images import VERSION
+from network.models import Post
+from network.tasks import process_post_image, process_user_image
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue processing of post and user images without current renditions, "
+        "like images uploaded before originals were stripped of metadata"
+    )
+
+    def handle(self, *args, **options):
+        for model, task in (
+            (Post, process_post_image),
+            (get_user_model(), process_user_image),
+        ):
+            ids = (
+                model.objects.exclude(image="")
+                .exclude(image__isnull=True)
+                .exclude(image_renditions__version=VERSION)
+                .values_list("id", flat=True)
+                .iterator()
+            )
+            queued = 0
+            for instance_id in ids:
+                task.delay(instance_id)
+                queued += 1
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {queued} queued")
+        self.stdout.write(self.style.SUCCESS("Images queued for processing"))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from network import follow_graph
+
+
+def follow_counter(field):
+    """Per-user amount of through table rows referencing the user by field"""
+    follow = get_user_model().followed_by.through
+    return Coalesce(
+        Subquery(
+            follow.objects.filter(**{field: OuterRef("id")})
+            .values(field)
+            .annotate(amount=Count("*"))
+            .values("amount")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate denormalized followers_count and following_count of users "
+        "and drop the cached follow graph"
+    )
+
+    def handle(self, *args, **options):
+        updated = get_user_model().objects.update(
+            followers_count=follow_counter("from_user"),
+            following_count=follow_counter("to_user"),
+        )
+        follow_graph.forget_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters of {updated} users"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from network.models import Post, Comment
+
+
+def counter_subquery(queryset):
+    """Per-post row count of the given related queryset, 0 if there are none"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(post_id=OuterRef("id"))
+            .values("post_id")
+            .annotate(amount=Count("*"))
+            .values("amount")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recalculate denormalized likes_count and comments_count of posts"
+
+    def handle(self, *args, **options):
+        updated = Post.objects.update(
+            likes_count=counter_subquery(Post.liked_by.through.objects.all()),
+            comments_count=counter_subquery(Comment.objects.all()),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters of {updated} posts"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from network import ranking
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate ranking scores of published posts from their likes and "
+        "comments, as of when they were added"
+    )
+
+    def handle(self, *args, **options):
+        updated = ranking.rebuild_scores()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt scores of {updated} posts"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from network.models import Post, TimelineEntry
+from network.tasks import fan_out_post
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from existing posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete all timeline entries before rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            TimelineEntry.objects.all().delete()
+
+        # scheduled posts are fanned out when they are published
+        post_ids = (
+            Post.objects.filter(is_published=True)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for post_id in post_ids.iterator():
+            fan_out_post(post_id)
+
+        self.stdout.write(self.style.SUCCESS("Timelines rebuilt"))
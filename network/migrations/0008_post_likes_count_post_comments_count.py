@@ -0,0 +1,46 @@
+# Generated by Django 4.2 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model("network", "Post")
+    Comment = apps.get_model("network", "Comment")
+
+    def counter(queryset):
+        return Coalesce(
+            Subquery(
+                queryset.filter(post_id=OuterRef("id"))
+                .values("post_id")
+                .annotate(amount=Count("*"))
+                .values("amount")
+            ),
+            0,
+        )
+
+    Post.objects.update(
+        likes_count=counter(Post.liked_by.through.objects.all()),
+        comments_count=counter(Comment.objects.all()),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0007_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comments_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
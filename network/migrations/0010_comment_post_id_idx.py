@@ -0,0 +1,16 @@
+# Generated by Django 4.2 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0009_post_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["post", "id"], name="comment_post_id_idx"),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0012_post_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="is_published",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_published", False)),
+                fields=["schedule"],
+                name="post_unpublished_schedule_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 18:30
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+UPDATE network_post SET hashtag_ids = ARRAY(
+    SELECT hashtag_id FROM network_post_hashtags
+    WHERE network_post_hashtags.post_id = network_post.id
+    ORDER BY hashtag_id
+);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0013_post_is_published"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="hashtag_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                blank=True,
+                default=list,
+                editable=False,
+                size=None,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["hashtag_ids"], name="post_hashtag_ids_idx"
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
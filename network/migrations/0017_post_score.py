@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+# rebuild_post_scores with the default ranking settings, ln(2) / 6 hours per
+# second since 2024-01-01 (network.ranking.EPOCH)
+BACKFILL_SQL = """
+UPDATE network_post SET score = ln(
+    1.0
+    + 0.5 * ln(1 + (
+        SELECT followers_count FROM user_user WHERE user_user.id = network_post.user_id
+    ))
+    + 1.0 * likes_count
+    + 3.0 * comments_count
+) + ln(2) / 21600 * (EXTRACT(EPOCH FROM created_at) - 1704067200)
+WHERE is_published;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0016_follow_suggestions"),
+        ("user", "0006_user_follow_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="score",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_published", True)),
+                fields=["-score", "-id"],
+                name="post_published_score_idx",
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
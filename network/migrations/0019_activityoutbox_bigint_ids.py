@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0018_timeline_user_created_post_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="activityoutbox",
+            name="actor_id",
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="activityoutbox",
+            name="post_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="activityoutbox",
+            name="recipient_id",
+            field=models.BigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-18 19:29
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("network", "0019_activityoutbox_bigint_ids"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="hashtag",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="hashtag_name_lower_idx",
+            ),
+        ),
+    ]
@@ -2,13 +2,23 @@ import os
 import uuid
 
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Func, OuterRef, Value
+from django.db.models.functions import Lower
+from django.db.models.signals import m2m_changed
 from django.utils.text import slugify
 
 
 class Hashtag(models.Model):
     name = models.CharField(max_length=255, unique=True)
 
+    class Meta:
+        indexes = [models.Index(Lower("name"), name="hashtag_name_lower_idx")]
+
     def __str__(self):
         return self.name
 
@@ -25,25 +35,180 @@ class Post(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField(blank=True)
     hashtags = models.ManyToManyField(Hashtag, related_name="posts", blank=True)
+    # copy of hashtags ids, GIN indexed to filter posts by hashtags without joins
+    hashtag_ids = ArrayField(
+        models.BigIntegerField(), default=list, blank=True, editable=False
+    )
     image = models.ImageField(null=True, upload_to=post_image_file_path, blank=True)
+    # resized copies of image, filled in by the process_post_image task
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="posts"
     )
     created_at = models.DateTimeField(auto_now_add=True)
     liked_by = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, related_name="liked_posts", blank=True
+        settings.AUTH_USER_MODEL, through="Like", related_name="liked_posts", blank=True
     )
     schedule = models.DateTimeField(null=True, blank=True)
+    # scheduled posts stay unpublished until publish_scheduled_posts picks them
+    is_published = models.BooleanField(default=True)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # engagement and recency for the ranked feed, see network.ranking
+    score = models.FloatField(default=0, editable=False)
+    # maintained by a database trigger from title (weight A) and content (weight B)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="post_created_id_idx"),
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="post_user_created_id_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="post_search_vector_idx"),
+            GinIndex(fields=["hashtag_ids"], name="post_hashtag_ids_idx"),
+            models.Index(
+                fields=["-score", "-id"],
+                condition=models.Q(is_published=True),
+                name="post_published_score_idx",
+            ),
+            models.Index(
+                fields=["schedule"],
+                condition=models.Q(is_published=False),
+                name="post_unpublished_schedule_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} post by {self.user} at {self.created_at}"
 
-    def toggle_like(self, user):
-        """Toggles the liked state of the post for the given user."""
-        if user in self.liked_by.all():
-            self.liked_by.remove(user)
+    @classmethod
+    def shift_counter(cls, post_id, field, delta, added_at):
+        """Atomically shifts a denormalized counter column by delta, and the
+        ranking score by the terms of delta likes or comments added at
+        added_at"""
+        from network import ranking
+
+        weight = {
+            "likes_count": settings.RANKING_LIKE_WEIGHT,
+            "comments_count": settings.RANKING_COMMENT_WEIGHT,
+        }[field]
+        if delta > 0:
+            score = ranking.add(weight * delta, added_at)
         else:
-            self.liked_by.add(user)
+            score = ranking.subtract(-delta * ranking.share(weight, added_at))
+        cls.objects.filter(id=post_id).update(**{field: F(field) + delta}, score=score)
+
+    @classmethod
+    def sync_hashtag_ids(cls, post_ids):
+        """Rebuilds the denormalized hashtag_ids of posts from the through table"""
+        through = cls.hashtags.through
+        cls.objects.filter(id__in=post_ids).update(
+            hashtag_ids=ArraySubquery(
+                through.objects.filter(post_id=OuterRef("id"))
+                .order_by("hashtag_id")
+                .values("hashtag_id")
+            )
+        )
+
+    @classmethod
+    def forget_hashtag(cls, hashtag_id):
+        """Drops hashtag_id from hashtag_ids of every post mentioning it"""
+        cls.objects.filter(hashtag_ids__contains=[hashtag_id]).update(
+            hashtag_ids=Func(
+                F("hashtag_ids"),
+                Value(hashtag_id),
+                function="array_remove",
+                output_field=cls._meta.get_field("hashtag_ids"),
+            )
+        )
+
+    def toggle_like(self, user) -> bool:
+        """Toggles the liked state of the post for the given user.
+
+        Only the single (post, user) row of the through table is touched, so the
+        cost does not depend on the amount of likes. Returns True if the post is
+        liked after the call.
+        """
+        with transaction.atomic():
+            like = (
+                Like.objects.select_for_update()
+                .filter(post_id=self.id, user_id=user.id)
+                .only("id", "created_at")
+                .first()
+            )
+            if like is not None:
+                like.delete()
+                liked = False
+                self.shift_counter(self.id, "likes_count", -1, like.created_at)
+            else:
+                try:
+                    with transaction.atomic():
+                        like = Like.objects.create(post_id=self.id, user_id=user.id)
+                except IntegrityError:
+                    # concurrent request of the same user has already liked it
+                    return True
+                liked = True
+                self.shift_counter(self.id, "likes_count", 1, like.created_at)
+            m2m_changed.send(
+                sender=Like,
+                instance=self,
+                action="post_add" if liked else "post_remove",
+                reverse=False,
+                model=type(user),
+                pk_set={user.id},
+                using=self._state.db,
+            )
+        return liked
+
+
+class Like(models.Model):
+    """Through table of Post.liked_by, with the time of the like for ranking"""
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "network_post_liked_by"
+        unique_together = ("post", "user")
+
+    def __str__(self):
+        return f"{self.post} liked by {self.user}"
+
+
+class TimelineEntry(models.Model):
+    """Materialized home timeline row: `post` is visible in the feed of `user`."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="unique_timeline_user_post"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at", "-post"],
+                name="timeline_user_created_post_idx",
+            ),
+            models.Index(fields=["user", "author"], name="timeline_user_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.post} in timeline of {self.user}"
 
 
 class Comment(models.Model):
@@ -52,3 +217,149 @@ class Comment(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="comments"
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["post", "id"], name="comment_post_id_idx")]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Post.shift_counter(self.post_id, "comments_count", 1, self.created_at)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Post.shift_counter(self.post_id, "comments_count", -1, self.created_at)
+        return result
+
+
+class Verb(models.TextChoices):
+    LIKE = "like"
+    UNLIKE = "unlike"
+    FOLLOW = "follow"
+    UNFOLLOW = "unfollow"
+    COMMENT = "comment"
+
+
+class ActivityOutbox(models.Model):
+    """Activity recorded in the transaction of the action, drained by Celery.
+
+    Plain ids without foreign keys keep the insert cheap on hot endpoints.
+    """
+
+    verb = models.CharField(max_length=16, choices=Verb.choices)
+    actor_id = models.BigIntegerField()
+    recipient_id = models.BigIntegerField()
+    post_id = models.BigIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Activity(models.Model):
+    """Append-only log of who did what and when"""
+
+    verb = models.CharField(max_length=16, choices=Verb.choices)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="activities"
+    )
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, null=True, related_name="activities"
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["actor", "-created_at"], name="activity_actor_idx"),
+            models.Index(
+                fields=["recipient", "-created_at"], name="activity_recipient_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.actor} {self.verb} at {self.created_at}"
+
+
+class Notification(models.Model):
+    """Activities of one kind on one target of the recipient, collapsed.
+
+    actors_count is the net amount of actors, undoing events decrement it.
+    """
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="notifications",
+    )
+    verb = models.CharField(max_length=16, choices=Verb.choices)
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, null=True, related_name="notifications"
+    )
+    last_actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="+",
+    )
+    actors_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient", "verb", "post"],
+                condition=models.Q(post__isnull=False),
+                name="unique_notification_post",
+            ),
+            models.UniqueConstraint(
+                fields=["recipient", "verb"],
+                condition=models.Q(post__isnull=True),
+                name="unique_notification_user",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["recipient", "-updated_at", "-id"],
+                name="notification_recipient_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.last_actor} and {self.actors_count - 1} others {self.verb}"
+
+
+class FollowSuggestion(models.Model):
+    """Precomputed "people you may know" of a user, see network.suggestions"""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="follow_suggestions",
+    )
+    suggested = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    score = models.FloatField()
+    # users the user follows who follow the suggested one
+    mutual_follows = models.PositiveIntegerField(default=0)
+    # posts liked by both
+    co_likes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "suggested"], name="unique_follow_suggestion"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-score", "id"], name="follow_suggestion_user_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested} suggested to {self.user}"
@@ -0,0 +1,155 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class SearchPaginationMixin:
+    """Paginates with search_pagination_class when the request has ?q= search"""
+
+    search_pagination_class = None
+
+    @property
+    def paginator(self):
+        if self.request is not None and self.request.query_params.get("q"):
+            if not hasattr(self, "_paginator"):
+                self._paginator = self.search_pagination_class()
+            return self._paginator
+        return super().paginator
+
+
+class PostCursorPagination(CursorPagination):
+    """Keyset pagination over posts, newest first"""
+
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class TimelineCursorPagination(PostCursorPagination):
+    """Keyset pagination over a home timeline merged from several sources,
+    newest first. Positions hold both created_at and the post id."""
+
+    def _decode_position(self, position):
+        created_at, _, post_id = position.partition("|")
+        try:
+            created_at, post_id = parse_datetime(created_at), int(post_id)
+        except ValueError:
+            created_at = None
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, post_id
+
+    def paginate_sources(self, sources, request, view=None):
+        """Returns ids of posts of the page, in feed order.
+
+        sources are (queryset, post id field) pairs of rows with created_at,
+        each is limited to a page before the union, so every source is a range
+        scan of its (created_at, post id) index.
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor and self.cursor.position
+        lookup = "gt" if reverse else "lt"
+        prefix = "" if reverse else "-"
+
+        pages = []
+        for queryset, id_field in sources:
+            if position:
+                created_at, post_id = self._decode_position(position)
+                queryset = queryset.filter(
+                    Q(**{f"created_at__{lookup}": created_at})
+                    | Q(created_at=created_at, **{f"{id_field}__{lookup}": post_id})
+                )
+            pages.append(
+                queryset.order_by(
+                    f"{prefix}created_at", f"{prefix}{id_field}"
+                ).values_list(id_field, "created_at")[: self.page_size + 1]
+            )
+        first, *others = pages
+        # UNION drops posts both in the timeline and of a read-time author,
+        # its columns are named by the first source
+        rows = list(
+            first.union(*others).order_by(
+                f"{prefix}created_at", f"{prefix}{sources[0][1]}"
+            )[: self.page_size + 1]
+        )
+        has_following = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+
+        if rows:
+            self.previous_position = self._position(rows[0])
+            self.next_position = self._position(rows[-1])
+        else:
+            self.previous_position = self.next_position = position
+        return [post_id for post_id, _ in rows]
+
+    @staticmethod
+    def _position(row):
+        post_id, created_at = row
+        return f"{created_at.isoformat()}|{post_id}"
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position)
+        )
+
+
+class PostSearchCursorPagination(CursorPagination):
+    """Keyset pagination over full-text search results, best match first"""
+
+    ordering = ("-rank", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class ScoreCursorPagination(CursorPagination):
+    """Keyset pagination over the ranked feed, highest score first.
+
+    Scores don't decay with time, see network.ranking, so positions of open
+    cursors stay valid.
+    """
+
+    ordering = ("-score", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination over primary key for users and hashtags"""
+
+    ordering = ("id",)
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class UserSearchCursorPagination(CursorPagination):
+    """Keyset pagination over user search results, best match first"""
+
+    ordering = ("-rank", "id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class NotificationCursorPagination(CursorPagination):
+    """Keyset pagination over notifications, recently updated first"""
+
+    ordering = ("-updated_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
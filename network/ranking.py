@@ -0,0 +1,150 @@
+"""Engagement score of posts for the ranked feed.
+
+The ranked value of a post is the sum of weighted terms, each halved every
+RANKING_HALF_LIFE_SECONDS since it was added:
+- the post itself and the popularity of its author, as of publishing,
+- every like and comment, as of when it was added, not before publishing.
+
+Halving every term at the same rate keeps the order of posts, so instead of
+decaying stored values the score is the sum in log space with ages measured
+from a fixed EPOCH, ln(sum of weight * 2^((added_at - EPOCH) / half-life)).
+Scores only change on engagement, reading the feed is a range scan of the
+(-score, -id) index and its cursors stay valid as time passes.
+
+Post.shift_counter adds the term of a like or comment and subtracts it on
+removal, as of the time stored on the like or comment.
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import (
+    F,
+    FloatField,
+    Func,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Exp, Greatest, Least, Ln
+
+from network.models import Comment, Like, Post
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _growth():
+    """Growth of the score per second, a term added a half-life later is
+    worth twice as much"""
+    return math.log(2) / settings.RANKING_HALF_LIFE_SECONDS
+
+
+def _seconds(at):
+    """Seconds from EPOCH to the datetime expression at"""
+    return Func(
+        at, template="EXTRACT(EPOCH FROM %(expressions)s)", output_field=FloatField()
+    ) - Value(EPOCH.timestamp())
+
+
+def _prior():
+    """Weight of a post without engagement"""
+    author_followers = Subquery(
+        get_user_model()
+        .objects.filter(id=OuterRef("user_id"))
+        .values("followers_count")[:1]
+    )
+    return settings.RANKING_POST_WEIGHT + settings.RANKING_AUTHOR_WEIGHT * Ln(
+        Coalesce(author_followers, 0, output_field=IntegerField()) + 1
+    )
+
+
+def _term(weight, added_at, published_at):
+    """Log-space term of weight added at added_at, not before publishing"""
+    if not hasattr(added_at, "resolve_expression"):
+        added_at = Value(added_at)
+    return math.log(weight) + _growth() * _seconds(Greatest(added_at, published_at))
+
+
+def add(weight, added_at):
+    """Score of a post with a term of weight added at added_at"""
+    score, term = F("score"), _term(weight, added_at, F("created_at"))
+    high, low = Greatest(score, term), Least(score, term)
+    # ln(e^high + e^low), exp() of postgres raises on underflow
+    return high + Ln(1 + Exp(Greatest(low - high, Value(-700.0))))
+
+
+def share(weight, added_at, score=F("score"), published_at=F("created_at")):
+    """Share of the term of weight added at added_at in the sum of a post.
+
+    Expressions of the post may be given, for a subquery of likes or comments.
+    """
+    term = _term(weight, added_at, published_at)
+    return Exp(Greatest(term - score, Value(-700.0)))
+
+
+def subtract(removed_share):
+    """Score without terms making removed_share of the sum.
+
+    Terms below double precision of the removed ones are lost with them, the
+    post keeps at least its term of publishing.
+    """
+    published = Ln(_prior()) + _growth() * _seconds(F("created_at"))
+    remaining = Greatest(1 - removed_share, Value(1e-300))
+    return Greatest(F("score") + Ln(remaining), published)
+
+
+def score_from_events():
+    """Score of a post from its likes and comments, as of when they were added"""
+    post, like, comment, user = (
+        Post._meta.db_table,
+        Like._meta.db_table,
+        Comment._meta.db_table,
+        get_user_model()._meta.db_table,
+    )
+    # summed relative to the newest term, so exp() doesn't overflow
+    sql = f"""(
+        WITH terms AS (
+            SELECT %s + %s * ln(1 + author.followers_count) AS weight,
+                {post}.created_at AS added_at
+            FROM {user} author WHERE author.id = {post}.user_id
+            UNION ALL
+            SELECT %s, GREATEST(likes.created_at, {post}.created_at)
+            FROM {like} likes WHERE likes.post_id = {post}.id
+            UNION ALL
+            SELECT %s, GREATEST(comments.created_at, {post}.created_at)
+            FROM {comment} comments WHERE comments.post_id = {post}.id
+        ), newest AS (SELECT max(added_at) AS added_at FROM terms)
+        SELECT ln(sum(terms.weight * exp(GREATEST(
+            %s * EXTRACT(EPOCH FROM terms.added_at - newest.added_at), -700
+        )))) + %s * (EXTRACT(EPOCH FROM newest.added_at) - %s)
+        FROM terms, newest GROUP BY newest.added_at
+    )"""
+    return RawSQL(
+        sql,
+        [
+            settings.RANKING_POST_WEIGHT,
+            settings.RANKING_AUTHOR_WEIGHT,
+            settings.RANKING_LIKE_WEIGHT,
+            settings.RANKING_COMMENT_WEIGHT,
+            _growth(),
+            _growth(),
+            EPOCH.timestamp(),
+        ],
+        output_field=FloatField(),
+    )
+
+
+def publish(post_ids):
+    """Scores freshly published posts"""
+    Post.objects.filter(id__in=post_ids).update(score=score_from_events())
+
+
+def rebuild_scores():
+    """Recomputes scores of published posts from their likes and comments.
+
+    Returns the amount of updated posts.
+    """
+    return Post.objects.filter(is_published=True).update(score=score_from_events())
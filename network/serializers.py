@@ -1,7 +1,66 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
-from network.models import Hashtag, Post, Comment
+from network import follow_graph
+from network.images import is_processed
+from network.models import (
+    Hashtag,
+    Post,
+    Comment,
+    FollowSuggestion,
+    Notification,
+    Verb,
+)
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ImageSrcsetField(serializers.Field):
+    """Renders image renditions as srcset strings per format.
+
+    Ex. {"webp": "/media/a.webp 160w, /media/b.webp 480w", "jpeg": "..."},
+    null while the current image is still being processed.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        if not is_processed(instance):
+            return None
+        renditions = instance.image_renditions
+
+        request = self.context.get("request")
+        srcset = {}
+        for fmt, paths in renditions["files"].items():
+            urls = []
+            for width, path in sorted(paths.items(), key=lambda item: int(item[0])):
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls.append(f"{url} {width}w")
+            srcset[fmt] = ", ".join(urls)
+        return srcset
+
+
+class ProcessedImageField(serializers.ImageField):
+    """Image upload, rendered only once processed: until then the stored file is
+    the upload, with its metadata, like EXIF location"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("required", False)
+        kwargs.setdefault("allow_null", True)
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if not is_processed(instance):
+            return None
+        return super().get_attribute(instance)
 
 
 class UserListSerializer(serializers.ModelSerializer):
@@ -12,9 +71,10 @@ class UserListSerializer(serializers.ModelSerializer):
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
-    followers = serializers.SlugRelatedField(
-        source="followed_by", many=True, read_only=True, slug_field="email"
-    )
+    followers = serializers.SerializerMethodField()
+    image = ProcessedImageField()
+    image_srcset = ImageSrcsetField()
+    is_followed = serializers.SerializerMethodField()
 
     class Meta:
         model = get_user_model()
@@ -26,36 +86,42 @@ class UserDetailSerializer(serializers.ModelSerializer):
             "last_name",
             "is_staff",
             "image",
+            "image_srcset",
             "bio",
+            "followers_count",
+            "following_count",
+            "is_followed",
             "followers",
         )
 
         read_only_fields = ("is_staff",)
         extra_kwargs = {"password": {"write_only": True, "min_length": 5}}
 
+    @extend_schema_field(serializers.ListField(child=serializers.EmailField()))
+    def get_followers(self, user):
+        """Emails of the first followers, the total is followers_count"""
+        followers = user.followed_by.order_by("id").values_list("email", flat=True)
+        return list(followers[: settings.RELATION_PREVIEW_SIZE])
+
+    def get_is_followed(self, user) -> bool:
+        """Whether the requesting user follows the user"""
+        request = self.context.get("request")
+        if request is None or not request.user.is_authenticated:
+            return False
+        return follow_graph.is_following(request.user.id, user.id)
+
+
+class FollowSuggestionSerializer(serializers.ModelSerializer):
+    user = UserListSerializer(source="suggested", read_only=True)
 
-class UserFollowSerializer(UserDetailSerializer):
     class Meta:
-        model = get_user_model()
-        fields = (
-            "id",
-            "email",
-            "first_name",
-            "last_name",
-            "is_staff",
-            "image",
-            "bio",
-            "followers",
-        )
-        read_only_fields = (
-            "id",
-            "email",
-            "first_name",
-            "last_name",
-            "is_staff",
-            "image",
-            "bio",
-        )
+        model = FollowSuggestion
+        fields = ("user", "score", "mutual_follows", "co_likes")
+
+
+class UserFollowSerializer(serializers.Serializer):
+    following = serializers.BooleanField(read_only=True)
+    followers_count = serializers.IntegerField(read_only=True)
 
 
 class HashtagSerializer(serializers.ModelSerializer):
@@ -64,6 +130,12 @@ class HashtagSerializer(serializers.ModelSerializer):
         fields = ("id", "name")
 
 
+class TrendingHashtagSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    uses = serializers.IntegerField(read_only=True)
+
+
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
@@ -85,6 +157,7 @@ class PostSerializer(serializers.ModelSerializer):
     author = serializers.SlugRelatedField(
         source="user", read_only=True, many=False, slug_field="email"
     )
+    image = ProcessedImageField()
     extra_kwargs = {"schedule": {"write_only": True}}
 
     class Meta:
@@ -97,20 +170,40 @@ class PostSerializer(serializers.ModelSerializer):
             "created_at",
             "image",
             "schedule",
+            "is_published",
             "author",
         )
+        read_only_fields = ("is_published",)
+
+
+class PostBulkItemSerializer(serializers.ModelSerializer):
+    """Single item of a bulk post creation.
+
+    Hashtag ids are only type checked here, their existence is verified for the
+    whole batch with one query.
+    """
+
+    hashtags = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Post
+        fields = ("title", "content", "hashtags", "schedule")
 
 
 class PostImageSerializer(serializers.ModelSerializer):
+    image = ProcessedImageField()
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Post
-        fields = ("id", "image")
+        fields = ("id", "image", "image_srcset")
 
 
 class PostListSerializer(PostSerializer):
     hashtags = HashtagSerializer(read_only=True, many=True)
-    likes = serializers.IntegerField(read_only=True)
-    comments_amount = serializers.IntegerField(read_only=True)
+    likes = serializers.IntegerField(source="likes_count", read_only=True)
+    comments_amount = serializers.IntegerField(source="comments_count", read_only=True)
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Post
@@ -118,13 +211,13 @@ class PostListSerializer(PostSerializer):
             "id",
             "title",
             "hashtags",
-            "image",
+            "image_srcset",
             "created_at",
             "likes",
             "comments_amount",
             "author",
         )
-        read_only_fields = ("id", "title", "image", "created_at", "author")
+        read_only_fields = ("id", "title", "created_at", "author")
 
 
 class PostDetailSerializer(serializers.ModelSerializer):
@@ -132,8 +225,10 @@ class PostDetailSerializer(serializers.ModelSerializer):
         source="user", read_only=True, many=False, slug_field="email"
     )
     hashtags = HashtagSerializer(read_only=True, many=True)
-    liked_by = UserListSerializer(many=True, read_only=True)
-    comments = CommentListSerializer(many=True, read_only=True)
+    image = ProcessedImageField()
+    image_srcset = ImageSrcsetField()
+    liked_by = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
     extra_kwargs = {"schedule": {"write_only": True}}
 
     class Meta:
@@ -144,41 +239,61 @@ class PostDetailSerializer(serializers.ModelSerializer):
             "content",
             "hashtags",
             "image",
+            "image_srcset",
             "created_at",
+            "is_published",
             "author",
+            "likes_count",
             "liked_by",
+            "comments_count",
             "comments",
         )
         read_only_fields = (
             "id",
+            "is_published",
             "author",
+            "likes_count",
+            "comments_count",
         )
 
-
-class PostToggleLikeSerializer(PostDetailSerializer):
-    class Meta:
-        model = Post
-        fields = (
-            "id",
-            "title",
-            "content",
-            "hashtags",
-            "image",
-            "created_at",
-            "author",
-            "liked_by",
-            "comments",
+    @staticmethod
+    def liked_by_queryset(post_id):
+        """First page of likers, the rest is served by /posts/{id}/likers/"""
+        return (
+            get_user_model()
+            .objects.filter(liked_posts=post_id)
+            .order_by("id")[: settings.RELATION_PREVIEW_SIZE]
         )
-        read_only_fields = (
-            "id",
-            "title",
-            "content",
-            "hashtags",
-            "image",
-            "created_at",
-            "author",
+
+    @staticmethod
+    def comments_queryset(post_id):
+        """First page of comments, the rest is served by /posts/{id}/comments/"""
+        return (
+            Comment.objects.filter(post_id=post_id)
+            .select_related("user")
+            .order_by("id")[: settings.RELATION_PREVIEW_SIZE]
         )
 
+    @extend_schema_field(UserListSerializer(many=True))
+    def get_liked_by(self, post):
+        # previews may be loaded up front, see network.async_views
+        likers = getattr(post, "liked_by_preview", None)
+        if likers is None:
+            likers = self.liked_by_queryset(post.id)
+        return UserListSerializer(likers, many=True, context=self.context).data
+
+    @extend_schema_field(CommentListSerializer(many=True))
+    def get_comments(self, post):
+        comments = getattr(post, "comments_preview", None)
+        if comments is None:
+            comments = self.comments_queryset(post.id)
+        return CommentListSerializer(comments, many=True, context=self.context).data
+
+
+class PostToggleLikeSerializer(serializers.Serializer):
+    liked = serializers.BooleanField(read_only=True)
+    likes_count = serializers.IntegerField(read_only=True)
+
 
 class CommentDetailSerializer(CommentSerializer):
     post = PostListSerializer(read_only=True)
@@ -189,3 +304,38 @@ class CommentDetailSerializer(CommentSerializer):
     class Meta:
         model = Comment
         fields = ("id", "content", "post", "author")
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    last_actor = serializers.SlugRelatedField(read_only=True, slug_field="email")
+    others_count = serializers.SerializerMethodField()
+    message = serializers.SerializerMethodField()
+
+    MESSAGES = {
+        Verb.LIKE: "liked your post",
+        Verb.FOLLOW: "followed you",
+        Verb.COMMENT: "commented on your post",
+    }
+
+    class Meta:
+        model = Notification
+        fields = (
+            "id",
+            "verb",
+            "post",
+            "last_actor",
+            "others_count",
+            "message",
+            "updated_at",
+        )
+
+    def get_others_count(self, notification) -> int:
+        return max(notification.actors_count - 1, 0)
+
+    def get_message(self, notification) -> str:
+        """Ex. 'john@mail.com and 40 others liked your post'"""
+        actor = notification.last_actor.email if notification.last_actor else "Someone"
+        others = self.get_others_count(notification)
+        if others:
+            actor += f" and {others} other{'s' if others > 1 else ''}"
+        return f"{actor} {self.MESSAGES[notification.verb]}"
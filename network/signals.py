@@ -0,0 +1,226 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.signals import (
+    post_save,
+    post_delete,
+    pre_delete,
+    m2m_changed,
+)
+from django.dispatch import receiver
+
+from network import activity, follow_graph, ranking
+from network.cache import invalidate_post, invalidate_post_lists
+from network.models import Comment, FollowSuggestion, Hashtag, Like, Post, Verb
+
+
+def _invalidate_on_commit(post_id):
+    transaction.on_commit(lambda: invalidate_post(post_id))
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_saved_post(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_commented_post(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.post_id)
+
+
+@receiver(m2m_changed, sender=Post.liked_by.through)
+@receiver(m2m_changed, sender=Post.hashtags.through)
+def invalidate_post_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _invalidate_on_commit(instance.id)
+    elif pk_set:
+        for post_id in pk_set:
+            _invalidate_on_commit(post_id)
+    else:
+        transaction.on_commit(invalidate_post_lists)
+
+
+@receiver(m2m_changed, sender=Post.hashtags.through)
+def sync_post_hashtag_ids(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        Post.sync_hashtag_ids([instance.id])
+    elif action == "post_clear":
+        Post.forget_hashtag(instance.id)
+    else:
+        Post.sync_hashtag_ids(pk_set)
+
+
+@receiver(post_delete, sender=Hashtag)
+def forget_deleted_hashtag(sender, instance, **kwargs):
+    Post.forget_hashtag(instance.id)
+
+
+@receiver(m2m_changed, sender=Post.liked_by.through)
+def record_like_activity(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    verb = Verb.LIKE if action == "post_add" else Verb.UNLIKE
+    if reverse:
+        authors = Post.objects.filter(id__in=pk_set).values_list("id", "user_id")
+        events = [(instance.id, author_id, post_id) for post_id, author_id in authors]
+    else:
+        events = [(user_id, instance.user_id, instance.id) for user_id in pk_set]
+    activity.record(verb, events)
+
+
+@receiver(m2m_changed, sender=get_user_model().followed_by.through)
+def record_follow_activity(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    verb = Verb.FOLLOW if action == "post_add" else Verb.UNFOLLOW
+    if reverse:
+        events = [(instance.id, user_id, None) for user_id in pk_set]
+    else:
+        events = [(user_id, instance.id, None) for user_id in pk_set]
+    activity.record(verb, events)
+
+
+@receiver(m2m_changed, sender=get_user_model().followed_by.through)
+def sync_follow_graph(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # related ids are gone by post_clear
+        if reverse:
+            pk_set = sender.objects.filter(to_user_id=instance.id).values_list(
+                "from_user_id", flat=True
+            )
+        else:
+            pk_set = sender.objects.filter(from_user_id=instance.id).values_list(
+                "to_user_id", flat=True
+            )
+        action = "post_remove"
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    if reverse:
+        edges = [(instance.id, user_id) for user_id in pk_set]
+    else:
+        edges = [(user_id, instance.id) for user_id in pk_set]
+    if action == "post_add":
+        transaction.on_commit(lambda: follow_graph.add_edges(edges))
+    else:
+        transaction.on_commit(lambda: follow_graph.remove_edges(edges))
+
+
+@receiver(m2m_changed, sender=get_user_model().followed_by.through)
+def drop_followed_suggestions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != "post_add" or not pk_set:
+        return
+    if reverse:
+        suggestions = FollowSuggestion.objects.filter(
+            user_id=instance.id, suggested_id__in=pk_set
+        )
+    else:
+        suggestions = FollowSuggestion.objects.filter(
+            user_id__in=pk_set, suggested_id=instance.id
+        )
+    suggestions.delete()
+
+
+@receiver(pre_delete, sender=get_user_model())
+def forget_deleted_user_graph(sender, instance, **kwargs):
+    """Follows of a deleted user are cascaded without m2m_changed, so the user
+    is dropped from the cached sets of followed users and followers here"""
+    follow = sender.followed_by.through
+    followed_ids = follow.objects.filter(to_user_id=instance.id).values_list(
+        "from_user_id", flat=True
+    )
+    follower_ids = follow.objects.filter(from_user_id=instance.id).values_list(
+        "to_user_id", flat=True
+    )
+    edges = [(instance.id, followed_id) for followed_id in followed_ids] + [
+        (follower_id, instance.id) for follower_id in follower_ids
+    ]
+
+    def forget():
+        follow_graph.remove_edges(edges)
+        follow_graph.forget(instance.id)
+
+    transaction.on_commit(forget)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def shift_deleted_user_counters(sender, instance, **kwargs):
+    """Likes, comments and follows of a deleted user are cascaded without
+    shifting the counters they are denormalized into, so every counter is
+    shifted here with one bulk update per table"""
+    # before rescoring posts, their score depends on followers of the author
+    follow = sender.followed_by.through
+    followed_ids = follow.objects.filter(to_user_id=instance.id).values("from_user_id")
+    follower_ids = follow.objects.filter(from_user_id=instance.id).values("to_user_id")
+    sender.objects.filter(Q(id__in=followed_ids) | Q(id__in=follower_ids)).exclude(
+        id=instance.id
+    ).update(
+        followers_count=Case(
+            When(id__in=followed_ids, then=F("followers_count") - 1),
+            default=F("followers_count"),
+            output_field=models.PositiveIntegerField(),
+        ),
+        following_count=Case(
+            When(id__in=follower_ids, then=F("following_count") - 1),
+            default=F("following_count"),
+            output_field=models.PositiveIntegerField(),
+        ),
+    )
+
+    # terms of the removed likes and comments are subtracted from scores as of
+    # when they were added, OuterRef is the post
+    def share(events, weight):
+        return Subquery(
+            events.filter(post_id=OuterRef("id"))
+            .values("post_id")
+            .annotate(
+                share=Sum(
+                    ranking.share(
+                        weight,
+                        F("created_at"),
+                        OuterRef("score"),
+                        OuterRef("created_at"),
+                    )
+                )
+            )
+            .values("share")
+        )
+
+    user_likes = Like.objects.filter(user_id=instance.id)
+    liked_post_ids = list(
+        user_likes.exclude(post__user=instance).values_list("post_id", flat=True)
+    )
+    Post.objects.filter(id__in=liked_post_ids).update(
+        likes_count=F("likes_count") - 1,
+        score=ranking.subtract(share(user_likes, settings.RANKING_LIKE_WEIGHT)),
+    )
+
+    user_comments = Comment.objects.filter(user_id=instance.id)
+    comments_per_post = Subquery(
+        user_comments.filter(post_id=OuterRef("id"))
+        .values("post_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Post.objects.filter(id__in=user_comments.values("post_id")).exclude(
+        user=instance
+    ).update(
+        comments_count=F("comments_count") - comments_per_post,
+        score=ranking.subtract(share(user_comments, settings.RANKING_COMMENT_WEIGHT)),
+    )
+
+    # removed likes don't send m2m_changed, comments invalidate their post
+    for post_id in liked_post_ids:
+        _invalidate_on_commit(post_id)
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_activity(sender, instance, created, **kwargs):
+    if created:
+        activity.record(
+            Verb.COMMENT, [(instance.user_id, instance.post.user_id, instance.post_id)]
+        )
@@ -0,0 +1,141 @@
+"""People you may know.
+
+Users are split into shards of SUGGESTIONS_SHARD_SIZE consecutive ids,
+computed by separate tasks. compute() loads the part of the follow and like
+graphs a shard needs into memory once and scores the candidates of every user
+with set operations, no per-user queries: friends of friends by the amount of
+followed users who follow them, and co-likers by the amount of posts both
+liked. Posts with more than SUGGESTIONS_MAX_POST_LIKERS likes are skipped, they
+say little about taste and cost quadratic time. The top SUGGESTIONS_PER_USER
+candidates replace the stored suggestions of users batch by batch.
+"""
+import heapq
+import itertools
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from network.models import FollowSuggestion, Post
+
+CHUNK_SIZE = 10_000
+
+
+def _adjacency(pairs):
+    graph = defaultdict(set)
+    for key, value in pairs:
+        graph[key].add(value)
+    return graph
+
+
+def user_id_ranges():
+    """(first id, last id) of shards of SUGGESTIONS_SHARD_SIZE users"""
+    size = settings.SUGGESTIONS_SHARD_SIZE
+    user_ids = get_user_model().objects.order_by("id").values_list("id", flat=True)
+    first_id = user_ids.first()
+    while first_id is not None:
+        # the last id of the shard and the first of the next one
+        bounds = list(user_ids.filter(id__gte=first_id)[size - 1 : size + 1])
+        if not bounds:
+            yield first_id, user_ids.last()
+            return
+        yield first_id, bounds[0]
+        first_id = bounds[1] if len(bounds) > 1 else None
+
+
+def load_graphs(first_id, last_id):
+    """followed ids by user, liked post ids by user and liker ids by post,
+    as far as users of the shard reach"""
+    follow = get_user_model().followed_by.through
+    in_shard = Q(to_user_id__gte=first_id, to_user_id__lte=last_id)
+    shard_followed = follow.objects.filter(in_shard).values("from_user_id")
+    following = _adjacency(
+        follow.objects.filter(in_shard | Q(to_user_id__in=shard_followed))
+        .values_list("to_user_id", "from_user_id")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    like = Post.liked_by.through
+    shard_likes = like.objects.filter(
+        user_id__gte=first_id,
+        user_id__lte=last_id,
+        post__likes_count__lte=settings.SUGGESTIONS_MAX_POST_LIKERS,
+    )
+    liked = _adjacency(
+        shard_likes.values_list("user_id", "post_id").iterator(chunk_size=CHUNK_SIZE)
+    )
+    likers = _adjacency(
+        like.objects.filter(post_id__in=shard_likes.values("post_id"))
+        .values_list("post_id", "user_id")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return following, liked, likers
+
+
+def candidates(user_id, following, liked, likers):
+    """Top (candidate id, score, mutual follows, co-likes) of the user"""
+    max_post_likers = settings.SUGGESTIONS_MAX_POST_LIKERS
+    co_like_weight = settings.SUGGESTIONS_CO_LIKE_WEIGHT
+
+    followed = following.get(user_id, set())
+    mutual = Counter()
+    for followed_id in followed:
+        mutual.update(following.get(followed_id, ()))
+    co_likes = Counter()
+    for post_id in liked.get(user_id, ()):
+        post_likers = likers.get(post_id, ())
+        if len(post_likers) <= max_post_likers:
+            co_likes.update(post_likers)
+
+    excluded = followed | {user_id}
+    scores = {
+        candidate: mutual[candidate] + co_like_weight * co_likes[candidate]
+        for candidate in mutual.keys() | co_likes.keys()
+        if candidate not in excluded
+    }
+    top = heapq.nlargest(
+        settings.SUGGESTIONS_PER_USER, scores.items(), key=lambda item: item[1]
+    )
+    return [
+        (candidate, score, mutual[candidate], co_likes[candidate])
+        for candidate, score in top
+    ]
+
+
+def compute(first_id, last_id):
+    """Replaces stored suggestions of users of the shard, returns the amount
+    stored"""
+    following, liked, likers = load_graphs(first_id, last_id)
+    user_ids = iter(
+        get_user_model()
+        .objects.filter(id__range=(first_id, last_id))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    stored = 0
+    while batch := list(itertools.islice(user_ids, settings.SUGGESTIONS_BATCH_SIZE)):
+        suggestions = [
+            FollowSuggestion(
+                user_id=user_id,
+                suggested_id=suggested_id,
+                score=score,
+                mutual_follows=mutual_follows,
+                co_likes=co_likes,
+            )
+            for user_id in batch
+            for suggested_id, score, mutual_follows, co_likes in candidates(
+                user_id, following, liked, likers
+            )
+        ]
+        try:
+            with transaction.atomic():
+                FollowSuggestion.objects.filter(user_id__in=batch).delete()
+                FollowSuggestion.objects.bulk_create(suggestions)
+        except IntegrityError:
+            # a user was deleted after the graphs were loaded, the next run
+            # refreshes this batch
+            continue
+        stored += len(suggestions)
+    return stored
@@ -1,16 +1,316 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 
-from network.serializers import PostSerializer
+from network import activity, follow_graph, ranking, suggestions
+from network.cache import invalidate_post, invalidate_post_lists
+from network.hashtags import (
+    attach_extracted_hashtags,
+    extract_hashtags,
+    resolve_hashtags,
+)
+from network.images import VERSION, build_renditions
+from network.models import Hashtag, Post, TimelineEntry
+from network.serializers import PostSerializer, PostBulkItemSerializer
+from network.trending import record_hashtags
 
 from celery import shared_task
+from rest_framework.exceptions import ValidationError
 
 
 @shared_task
 def create_post(data):
+    """Creates a post scheduled with a Celery ETA.
+
+    Kept to drain tasks queued before scheduled posts were stored in the database,
+    new ones are published by publish_scheduled_posts.
+    """
     user_id = data.pop("user_id")
     serializer = PostSerializer(data=data)
     if serializer.is_valid():
         user = get_user_model().objects.get(id=user_id)
-        serializer.save(user=user)
+        post = serializer.save(user=user)
+        attach_extracted_hashtags(post)
+        on_posts_published.delay([post.id])
         return "Successfully created new post"
     return serializer.errors
+
+
+def bulk_create_posts(user, items):
+    """Validates and creates many posts of the user in one pass.
+
+    Posts and their hashtag links are inserted with bulk_create. Returns ids of
+    created posts and validation errors keyed by the index of the failed item.
+    """
+    errors = {}
+    valid = []
+    # one serializer instance validates every item, fields are built only once
+    item_serializer = PostBulkItemSerializer()
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, item_serializer.run_validation(item)))
+        except ValidationError as error:
+            errors[index] = error.detail
+
+    hashtag_ids = {pk for _, data in valid for pk in data.get("hashtags", [])}
+    existing_ids = set(
+        Hashtag.objects.filter(id__in=hashtag_ids).values_list("id", flat=True)
+    )
+    accepted = []
+    for index, data in valid:
+        hashtags = set(data.pop("hashtags", []))
+        missing = sorted(hashtags - existing_ids)
+        if missing:
+            errors[index] = {
+                "hashtags": [
+                    f'Invalid pk "{pk}" - object does not exist.' for pk in missing
+                ]
+            }
+            continue
+        mentioned = extract_hashtags(data.get("title"), data.get("content"))
+        accepted.append((data, hashtags, mentioned))
+
+    now = timezone.now()
+    posts = []
+    posts_hashtags = []
+    post_hashtag = Post.hashtags.through
+    with transaction.atomic():
+        # hashtags are only created for accepted posts, rolled back with them
+        mentioned_ids = resolve_hashtags(
+            set().union(*(mentioned for _, _, mentioned in accepted))
+        )
+        for data, hashtags, mentioned in accepted:
+            hashtags.update(mentioned_ids[name] for name in mentioned)
+            schedule = data.get("schedule")
+            posts.append(
+                Post(
+                    user=user,
+                    is_published=schedule is None or schedule <= now,
+                    hashtag_ids=sorted(hashtags),
+                    **data,
+                )
+            )
+            posts_hashtags.append(hashtags)
+
+        Post.objects.bulk_create(posts, batch_size=settings.BULK_POSTS_BATCH_SIZE)
+        post_hashtag.objects.bulk_create(
+            [
+                post_hashtag(post_id=post.id, hashtag_id=hashtag_id)
+                for post, hashtags in zip(posts, posts_hashtags)
+                for hashtag_id in hashtags
+            ],
+            batch_size=settings.BULK_POSTS_BATCH_SIZE,
+        )
+        published_ids = [post.id for post in posts if post.is_published]
+        if published_ids:
+            transaction.on_commit(lambda: on_posts_published.delay(published_ids))
+        if posts:
+            transaction.on_commit(invalidate_post_lists)
+
+    return [post.id for post in posts], errors
+
+
+@shared_task
+def create_posts(user_id, items):
+    """Batched variant of create_post for importers"""
+    user = get_user_model().objects.get(id=user_id)
+    created, errors = bulk_create_posts(user, items)
+    return {"created": created, "errors": errors}
+
+
+@shared_task
+def publish_scheduled_posts():
+    """Publishes due scheduled posts in batches.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any amount of
+    workers can run this concurrently without publishing a post twice.
+    """
+    published = 0
+    while True:
+        with transaction.atomic():
+            post_ids = list(
+                Post.objects.select_for_update(skip_locked=True)
+                .filter(is_published=False, schedule__lte=timezone.now())
+                .order_by("schedule")
+                .values_list("id", flat=True)[: settings.SCHEDULED_POSTS_BATCH_SIZE]
+            )
+            Post.objects.filter(id__in=post_ids).update(
+                is_published=True, created_at=F("schedule")
+            )
+            if post_ids:
+                transaction.on_commit(
+                    lambda post_ids=post_ids: on_posts_published.delay(post_ids)
+                )
+                transaction.on_commit(invalidate_post_lists)
+
+        published += len(post_ids)
+        if len(post_ids) < settings.SCHEDULED_POSTS_BATCH_SIZE:
+            return f"Published {published} scheduled posts"
+
+
+def _add_to_timelines(post, follower_ids):
+    def entries(user_ids):
+        return [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.id,
+                author_id=post.user_id,
+                created_at=post.created_at,
+            )
+            for user_id in user_ids
+        ]
+
+    try:
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                entries(follower_ids), ignore_conflicts=True
+            )
+    except IntegrityError:
+        # a follower was deleted after the cached follower set was read
+        TimelineEntry.objects.bulk_create(
+            entries(
+                get_user_model()
+                .objects.filter(id__in=follower_ids)
+                .values_list("id", flat=True)
+            ),
+            ignore_conflicts=True,
+        )
+
+
+@shared_task
+def fan_out_post(post_id):
+    """Push a new post into the materialized timelines of the author's followers.
+
+    Authors with more than TIMELINE_FANOUT_FOLLOWERS_LIMIT followers are skipped,
+    their posts are merged into the feed at read time instead.
+    """
+    post = (
+        Post.objects.filter(id=post_id)
+        .select_related("user")
+        .only("id", "user_id", "created_at", "is_published", "user__followers_count")
+        .first()
+    )
+    if post is None:
+        return "Post was deleted before fan-out"
+    if not post.is_published:
+        # fanned out by on_posts_published, with the time of publishing
+        return "Post is not published yet"
+    if post.user.followers_count > settings.TIMELINE_FANOUT_FOLLOWERS_LIMIT:
+        return "Author has too many followers, post is served on read"
+
+    follower_ids = sorted(follow_graph.follower_ids(post.user_id))
+    batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+    for start in range(0, len(follower_ids), batch_size):
+        _add_to_timelines(post, follower_ids[start : start + batch_size])
+    return "Successfully fanned out post"
+
+
+@shared_task
+def on_posts_published(post_ids):
+    """Scores freshly published posts, counts their hashtags for trending and
+    fans them out"""
+    ranking.publish(post_ids)
+    record_hashtags(
+        Post.hashtags.through.objects.filter(post_id__in=post_ids).values_list(
+            "hashtag_id", flat=True
+        )
+    )
+    for post_id in post_ids:
+        fan_out_post(post_id)
+    return f"Successfully published {len(post_ids)} posts"
+
+
+@shared_task
+def sync_follow_timeline(follower_id, author_id, following):
+    """Backfill or purge the follower's timeline after a follow toggle"""
+    if not following:
+        TimelineEntry.objects.filter(user_id=follower_id, author_id=author_id).delete()
+        return "Removed unfollowed user posts from timeline"
+
+    posts = Post.objects.filter(user_id=author_id, is_published=True).order_by(
+        "-created_at"
+    )[: settings.TIMELINE_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=follower_id,
+                post_id=post.id,
+                author_id=author_id,
+                created_at=post.created_at,
+            )
+            for post in posts.only("id", "created_at")
+        ],
+        ignore_conflicts=True,
+    )
+    return "Backfilled timeline with followed user posts"
+
+
+@shared_task
+def drain_activity_outbox():
+    """Moves recorded likes, follows and comments to activities and notifications"""
+    drained = 0
+    while True:
+        batch = activity.drain_outbox()
+        drained += batch
+        if batch < settings.ACTIVITY_OUTBOX_BATCH_SIZE:
+            return f"Drained {drained} activity events"
+
+
+@shared_task(time_limit=settings.SUGGESTIONS_SHARD_TIME_LIMIT)
+def compute_follow_suggestions():
+    """Refreshes "people you may know" of every user, a task per shard of users"""
+    shards = 0
+    for first_id, last_id in suggestions.user_id_ranges():
+        compute_follow_suggestions_shard.delay(first_id, last_id)
+        shards += 1
+    return f"Queued {shards} follow suggestions shards"
+
+
+@shared_task(time_limit=settings.SUGGESTIONS_SHARD_TIME_LIMIT)
+def compute_follow_suggestions_shard(first_id, last_id):
+    """Refreshes "people you may know" of users with ids in the range"""
+    stored = suggestions.compute(first_id, last_id)
+    return f"Stored {stored} follow suggestions"
+
+
+def _process_image(queryset, instance_id, folder):
+    """Replaces the uploaded image of the instance by its stripped original and
+    stores renditions, returns whether the instance was updated"""
+    instance = (
+        queryset.filter(id=instance_id).only("id", "image", "image_renditions").first()
+    )
+    if instance is None or not instance.image:
+        return False
+    renditions = instance.image_renditions
+    if renditions.get("version") == VERSION and renditions.get("source") == (
+        instance.image.name
+    ):
+        # processed already, or unreadable
+        return False
+
+    uploaded = instance.image.name
+    renditions = build_renditions(instance.image, folder)
+    # skip saving if the image was replaced while the renditions were generated
+    updated = queryset.filter(id=instance_id, image=uploaded).update(
+        image=renditions["source"], image_renditions=renditions
+    )
+    if updated and renditions["source"] != uploaded:
+        instance.image.storage.delete(uploaded)
+    return bool(updated)
+
+
+@shared_task
+def process_post_image(post_id):
+    if _process_image(Post.objects.all(), post_id, "uploads/posts/"):
+        invalidate_post(post_id)
+        return "Successfully processed post image"
+    return "Post has no image to process"
+
+
+@shared_task
+def process_user_image(user_id):
+    if _process_image(get_user_model().objects.all(), user_id, "uploads/users/"):
+        return "Successfully processed user image"
+    return "User has no image to process"
@@ -0,0 +1,163 @@
+"""Token bucket throttles for write hot spots.
+
+A bucket holds up to `num_requests` tokens and refills at num_requests/duration
+tokens per second, so short bursts pass while the sustained rate is capped.
+Buckets live in Redis, all buckets of a request are checked and updated by one
+Lua script call.
+"""
+import math
+
+import redis
+from django.conf import settings
+from rest_framework.throttling import (
+    ScopedRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
+
+# KEYS - buckets; ARGV - capacity and refill rate in tokens per second of each
+# bucket, in pairs. A request is allowed when every bucket has a token, and then
+# takes one from each. Returns whether the request is allowed and tokens left
+# in each bucket, as strings to keep the fraction. Redis server time is used, so
+# app servers may disagree on time.
+TOKEN_BUCKET_LUA = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local allowed = 1
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call("HMGET", key, "tokens", "updated_at")
+    local left = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens[i] = math.min(capacity, left + math.max(0, now - updated_at) * rate)
+    if tokens[i] < 1 then
+        allowed = 0
+    end
+end
+
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    tokens[i] = tokens[i] - allowed
+    redis.call("HSET", key, "tokens", tostring(tokens[i]), "updated_at", tostring(now))
+    redis.call("EXPIRE", key, math.ceil((capacity - tokens[i]) / rate) + 1)
+    result[i + 1] = tostring(tokens[i])
+end
+return result
+"""
+
+_client = None
+_script = None
+
+
+def _token_bucket():
+    global _client, _script
+    if _script is None:
+        _client = redis.Redis.from_url(settings.THROTTLE_REDIS_URL)
+        _script = _client.register_script(TOKEN_BUCKET_LUA)
+    return _script
+
+
+class TokenBucketRateThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle with its rate applied as a Redis token bucket.
+
+    Fails open when Redis is unavailable. State of the tightest bucket is left
+    on the request for RateLimitHeadersMixin.
+    """
+
+    def buckets(self, request, view):
+        """(key, capacity, refill rate) of buckets the request takes a token from"""
+        if self.rate is None:
+            return []
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return []
+        return [(key, self.num_requests, self.num_requests / self.duration)]
+
+    def allow_request(self, request, view):
+        buckets = self.buckets(request, view)
+        if not buckets:
+            return True
+
+        try:
+            allowed, *tokens = _token_bucket()(
+                keys=[key for key, _, _ in buckets],
+                args=[arg for _, capacity, rate in buckets for arg in (capacity, rate)],
+            )
+        except redis.RedisError:
+            return True
+
+        self.waits = []
+        for (_, capacity, rate), left in zip(buckets, tokens):
+            left = float(left)
+            self.waits.append(max(0.0, (1 - left) / rate))
+            state = (capacity, math.floor(left), math.ceil((capacity - left) / rate))
+            current = getattr(request, "rate_limit", None)
+            if current is None or state[1] < current[1]:
+                request.rate_limit = state
+        return bool(allowed)
+
+    def wait(self):
+        """Seconds until every bucket has a token again"""
+        return max(self.waits)
+
+
+class ScopedTokenBucketThrottle(TokenBucketRateThrottle, ScopedRateThrottle):
+    """Per endpoint bucket of every user, or of the ip for anonymous requests.
+
+    The endpoint is named by the `throttle_scope` of the view.
+    """
+
+    def buckets(self, request, view):
+        # the rate depends on the view, as in ScopedRateThrottle.allow_request
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return []
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().buckets(request, view)
+
+
+class UserWritesTokenBucketThrottle(UserRateThrottle, TokenBucketRateThrottle):
+    """Bucket shared by all write endpoints of a user"""
+
+    scope = "writes"
+
+
+class WriteTokenBucketThrottle(TokenBucketRateThrottle):
+    """Per endpoint bucket and the bucket shared by all write endpoints of a
+    user, checked with one script call.
+
+    A request denied by one bucket takes no token from the other.
+    """
+
+    def __init__(self):
+        self.throttles = (ScopedTokenBucketThrottle(), UserWritesTokenBucketThrottle())
+
+    def buckets(self, request, view):
+        return [
+            bucket
+            for throttle in self.throttles
+            for bucket in throttle.buckets(request, view)
+        ]
+
+
+class RateLimitHeadersMixin:
+    """Adds RateLimit-Limit, -Remaining and -Reset headers of the tightest bucket.
+
+    Throttled responses also get Retry-After from DRF.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        rate_limit = getattr(request, "rate_limit", None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response["RateLimit-Limit"] = str(limit)
+            response["RateLimit-Remaining"] = str(remaining)
+            response["RateLimit-Reset"] = str(reset)
+        return response
@@ -0,0 +1,74 @@
+import time
+from collections import Counter
+
+import redis
+from django.conf import settings
+
+WINDOW_KEY = "network:trending:window"
+
+_client = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.TRENDING_REDIS_URL)
+    return _client
+
+
+def _bucket_key(bucket):
+    return f"network:trending:{bucket}"
+
+
+def _current_bucket():
+    return int(time.time() // settings.TRENDING_BUCKET_SECONDS)
+
+
+def record_hashtags(hashtag_ids):
+    """Counts usage of hashtags in the current time bucket, ids may repeat.
+
+    Usage is lost while redis is unavailable, publishing posts doesn't fail.
+    """
+    usage = Counter(hashtag_ids)
+    if not usage:
+        return
+    key = _bucket_key(_current_bucket())
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for hashtag_id, amount in usage.items():
+            pipe.zincrby(key, amount, hashtag_id)
+        pipe.expire(
+            key, settings.TRENDING_WINDOW_SECONDS + settings.TRENDING_BUCKET_SECONDS
+        )
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def top_hashtags(limit):
+    """(hashtag id, usage count) pairs of the most used hashtags in the window.
+
+    The union of bucket counters is kept for TRENDING_CACHE_SECONDS, so reads
+    mostly cost a single ZREVRANGE. Nothing is trending while redis is
+    unavailable.
+    """
+    try:
+        client = _redis()
+        if not client.exists(WINDOW_KEY):
+            current = _current_bucket()
+            buckets = (
+                settings.TRENDING_WINDOW_SECONDS // settings.TRENDING_BUCKET_SECONDS
+            )
+            keys = [
+                _bucket_key(bucket)
+                for bucket in range(current - buckets + 1, current + 1)
+            ]
+            pipe = client.pipeline()
+            pipe.zunionstore(WINDOW_KEY, keys)
+            pipe.expire(WINDOW_KEY, settings.TRENDING_CACHE_SECONDS)
+            pipe.execute()
+        top = client.zrevrange(WINDOW_KEY, 0, limit - 1, withscores=True)
+    except redis.RedisError:
+        return []
+
+    return [(int(hashtag_id), int(score)) for hashtag_id, score in top]
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 
+from network.async_views import AsyncPostListView, AsyncPostDetailView
 from network.views import (
     UserViewSet,
     HashtagViewSet,
@@ -9,6 +11,9 @@ from network.views import (
     UserToggleFollowView,
     AddCommentView,
     ManageCommentView,
+    CacheStatsView,
+    DatabaseStatsView,
+    NotificationListView,
 )
 
 router = routers.DefaultRouter()
@@ -34,6 +39,56 @@ urlpatterns = [
         name="post_add_comment",
     ),
     path("comments/<int:pk>/", ManageCommentView.as_view(), name="manage-comment"),
+    path("cache-stats/", CacheStatsView.as_view(), name="cache_stats"),
+    path("db-stats/", DatabaseStatsView.as_view(), name="db_stats"),
+    path("notifications/", NotificationListView.as_view(), name="notifications"),
 ]
 
+if settings.ASYNC_READ_VIEWS:
+    # hot read endpoints served without blocking a worker when run under ASGI,
+    # writes to the same urls still go to PostViewSet
+    urlpatterns = [
+        path(
+            "posts/",
+            AsyncPostListView.as_view(
+                action="list",
+                fallback_view=PostViewSet.as_view({"get": "list", "post": "create"}),
+            ),
+        ),
+        path(
+            "posts/liked/",
+            AsyncPostListView.as_view(
+                action="see_liked_posts",
+                fallback_view=PostViewSet.as_view({"get": "see_liked_posts"}),
+            ),
+        ),
+        path(
+            "posts/my/",
+            AsyncPostListView.as_view(
+                action="see_my_posts",
+                fallback_view=PostViewSet.as_view({"get": "see_my_posts"}),
+            ),
+        ),
+        path(
+            "posts/following/",
+            AsyncPostListView.as_view(
+                action="see_following_users_posts",
+                fallback_view=PostViewSet.as_view({"get": "see_following_users_posts"}),
+            ),
+        ),
+        path(
+            "posts/<int:pk>/",
+            AsyncPostDetailView.as_view(
+                fallback_view=PostViewSet.as_view(
+                    {
+                        "get": "retrieve",
+                        "put": "update",
+                        "patch": "partial_update",
+                        "delete": "destroy",
+                    }
+                ),
+            ),
+        ),
+    ] + urlpatterns
+
 app_name = "network"
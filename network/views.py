@@ -1,34 +1,80 @@
-import datetime
-
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest, Upper
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, viewsets, status, generics
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-
-from network.models import Hashtag, Post, Comment
+from rest_framework.views import APIView
+
+from network import cache, trending
+from network.hashtags import attach_extracted_hashtags, extract_hashtags
+
+from network.models import (
+    Hashtag,
+    Post,
+    Comment,
+    FollowSuggestion,
+    Notification,
+    TimelineEntry,
+)
+from network.pagination import (
+    SearchPaginationMixin,
+    PostCursorPagination,
+    PostSearchCursorPagination,
+    ScoreCursorPagination,
+    TimelineCursorPagination,
+    UserSearchCursorPagination,
+    IdCursorPagination,
+    NotificationCursorPagination,
+)
 from network.permissions import IsOwnerOrReadOnly, IsUserOrReadOnly
 from network.serializers import (
     UserListSerializer,
     UserDetailSerializer,
     UserFollowSerializer,
+    FollowSuggestionSerializer,
     HashtagSerializer,
+    TrendingHashtagSerializer,
     PostSerializer,
     PostImageSerializer,
+    PostBulkItemSerializer,
     PostListSerializer,
     PostDetailSerializer,
     PostToggleLikeSerializer,
     CommentSerializer,
+    CommentListSerializer,
     CommentDetailSerializer,
+    NotificationSerializer,
 )
-from network.tasks import create_post
+from network.throttling import (
+    RateLimitHeadersMixin,
+    WriteTokenBucketThrottle,
+)
+from network.tasks import (
+    bulk_create_posts,
+    on_posts_published,
+    sync_follow_timeline,
+    process_post_image,
+    process_user_image,
+)
+from social_media import db_pool
 
 
 class UserViewSet(
+    SearchPaginationMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -37,6 +83,8 @@ class UserViewSet(
 ):
     queryset = get_user_model().objects.all()
     permission_classes = (IsAuthenticated, IsUserOrReadOnly)
+    search_pagination_class = UserSearchCursorPagination
+    query_budget = {"list": 3, "retrieve": 4, "see_suggestions": 2}
 
     def get_queryset(self):
         queryset = get_user_model().objects.all()
@@ -52,13 +100,49 @@ class UserViewSet(
         if last_name:
             queryset = queryset.filter(last_name__icontains=last_name)
 
-        return queryset.distinct()
+        search = self.request.query_params.get("q")
+        if search:
+            # UPPER() expressions match the trigram indexes icontains also uses
+            queryset = (
+                queryset.alias(
+                    email_upper=Upper("email"),
+                    first_name_upper=Upper("first_name"),
+                    last_name_upper=Upper("last_name"),
+                )
+                .filter(
+                    Q(email_upper__trigram_word_similar=search)
+                    | Q(first_name_upper__trigram_word_similar=search)
+                    | Q(last_name_upper__trigram_word_similar=search)
+                    | Q(email__istartswith=search)
+                    | Q(first_name__istartswith=search)
+                    | Q(last_name__istartswith=search)
+                )
+                .annotate(
+                    rank=Cast(
+                        Greatest(
+                            TrigramWordSimilarity(search, "email_upper"),
+                            TrigramWordSimilarity(search, "first_name_upper"),
+                            TrigramWordSimilarity(search, "last_name_upper"),
+                        ),
+                        FloatField(),
+                    )
+                )
+            )
+
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
             return UserListSerializer
+        if self.action == "see_suggestions":
+            return FollowSuggestionSerializer
         return UserDetailSerializer
 
+    def perform_update(self, serializer):
+        user = serializer.save()
+        if serializer.validated_data.get("image"):
+            process_user_image.delay(user.id)
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -76,52 +160,186 @@ class UserViewSet(
                 type=OpenApiTypes.STR,
                 description="Filter by last_name contains (ex. ?first_name=K)",
             ),
+            OpenApiParameter(
+                "q",
+                type=OpenApiTypes.STR,
+                description="Fuzzy search by email, first or last name prefix, "
+                "results are ordered by similarity (ex. ?q=jon)",
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(responses=FollowSuggestionSerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="suggestions",
+        pagination_class=None,
+        description="people you may know, refreshed periodically",
+    )
+    def see_suggestions(self, request):
+        suggestions = (
+            FollowSuggestion.objects.filter(user=request.user)
+            .select_related("suggested")
+            .order_by("-score", "id")[: settings.SUGGESTIONS_PER_USER]
+        )
+        serializer = self.get_serializer(suggestions, many=True)
+        return Response(serializer.data)
+
 
 class HashtagViewSet(viewsets.ModelViewSet):
     queryset = Hashtag.objects.all()
     serializer_class = HashtagSerializer
     permission_classes = (IsAuthenticated,)
+    query_budget = {"list": 2, "trending": 2}
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "limit",
+                type=OpenApiTypes.INT,
+                description="Amount of hashtags, at most 50 (ex. ?limit=10)",
+            )
+        ],
+        responses=TrendingHashtagSerializer(many=True),
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="trending",
+        description="see hashtags used the most over the last day",
+    )
+    def trending(self, request):
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            limit = 10
+        top = trending.top_hashtags(max(limit, 1))
+        hashtags = Hashtag.objects.in_bulk([hashtag_id for hashtag_id, _ in top])
+        data = [
+            {"id": hashtag_id, "name": hashtags[hashtag_id].name, "uses": uses}
+            for hashtag_id, uses in top
+            if hashtag_id in hashtags
+        ]
+        return Response(TrendingHashtagSerializer(data, many=True).data)
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(SearchPaginationMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     permission_classes = (IsAuthenticated, IsOwnerOrReadOnly)
+    pagination_class = PostCursorPagination
+    search_pagination_class = PostSearchCursorPagination
+    query_budget = {
+        "list": 4,
+        "see_following_users_posts": 4,
+        "see_liked_posts": 4,
+        "see_my_posts": 4,
+        "see_for_you_posts": 4,
+        "retrieve": 5,
+        "see_likers": 4,
+        "see_comments": 4,
+        "create": 15,
+    }
+
+    @staticmethod
+    def _ids_to_ints(qs, param):
+        """Converts a list of string IDs of the query param to a list of integers"""
+        try:
+            ids = [int(str_id) for str_id in qs.split(",")]
+        except ValueError:
+            ids = None
+        # hashtag_ids is an array of bigint
+        if not ids or not all(0 < id_ < 2**63 for id_ in ids):
+            raise ValidationError({param: "Expected comma separated hashtag ids."})
+        return ids
 
     @staticmethod
-    def _ids_to_ints(qs):
-        """Converts a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(",")]
+    def _read_time_authors(user):
+        """Followed users with too many followers to be fanned out on write.
+
+        Kept a lazy subquery, querysets are built on the event loop by the async
+        views, where nothing may run a query.
+        """
+        return (
+            get_user_model()
+            .objects.filter(
+                followed_by=user,
+                followers_count__gt=settings.TIMELINE_FANOUT_FOLLOWERS_LIMIT,
+            )
+            .values("id")
+        )
+
+    def _timeline_filter(self, user):
+        """Posts materialized in the user's timeline plus posts of followed
+        users with too many followers to be fanned out on write"""
+        return Q(id__in=TimelineEntry.objects.filter(user=user).values("post_id")) | Q(
+            user__in=self._read_time_authors(user)
+        )
+
+    def _hashtags_filter(self, prefix=""):
+        """Filter of the hashtags query params, prefix is the path to the post"""
+        hashtags_filter = Q()
+        hashtags = self.request.query_params.get("hashtags")
+        if hashtags:
+            ids = self._ids_to_ints(hashtags, "hashtags")
+            hashtags_filter &= Q(**{f"{prefix}hashtag_ids__overlap": ids})
+        hashtags_all = self.request.query_params.get("hashtags_all")
+        if hashtags_all:
+            ids = self._ids_to_ints(hashtags_all, "hashtags_all")
+            hashtags_filter &= Q(**{f"{prefix}hashtag_ids__contains": ids})
+        hashtags_exclude = self.request.query_params.get("hashtags_exclude")
+        if hashtags_exclude:
+            ids = self._ids_to_ints(hashtags_exclude, "hashtags_exclude")
+            hashtags_filter &= ~Q(**{f"{prefix}hashtag_ids__overlap": ids})
+        return hashtags_filter
 
     def get_queryset(self):
         queryset = (
             Post.objects.select_related("user")
             .prefetch_related("hashtags")
-            .prefetch_related("comments__user")
-            .annotate(likes=Count("liked_by"), comments_amount=Count("comments"))
+            .defer("search_vector")
         )
+        if self.action in (
+            "retrieve",
+            "see_my_posts",
+            "update",
+            "partial_update",
+            "destroy",
+            "upload_image",
+        ):
+            # scheduled posts are visible and editable only for their author
+            queryset = queryset.filter(Q(is_published=True) | Q(user=self.request.user))
+        else:
+            queryset = queryset.filter(is_published=True)
+
         if self.action == "see_my_posts":
-            user = get_user_model().objects.get(id=self.request.user.id)
-            queryset = queryset.filter(user__id__in=[user.id])
-        if self.action == "see_following_users_posts":
-            user = get_user_model().objects.get(id=self.request.user.id)
-            following_users = user.users.all()
-            queryset = queryset.filter(user__in=following_users)
+            queryset = queryset.filter(user=self.request.user)
+        search = self.request.query_params.get("q")
+        if self.action == "see_following_users_posts" and search:
+            # without search the feed is paged from the timeline, see below
+            queryset = queryset.filter(self._timeline_filter(self.request.user))
         if self.action == "see_liked_posts":
-            user = get_user_model().objects.get(id=self.request.user.id)
-            queryset = queryset.filter(liked_by__id__in=[user.id])
-
-        hashtags = self.request.query_params.get("hashtags")
-        if hashtags:
-            queryset = queryset.filter(
-                hashtags__id__in=self._ids_to_ints(hashtags)
-            ).order_by("id")
+            queryset = queryset.filter(liked_by=self.request.user)
+
+        queryset = queryset.filter(self._hashtags_filter())
+
+        if search:
+            query = SearchQuery(search, search_type="websearch", config="english")
+            # only the most recent matches are ranked, so ts_rank reads a
+            # bounded amount of search vectors however common the terms are
+            recent_matches = (
+                queryset.filter(search_vector=query)
+                .order_by("-created_at", "-id")
+                .values("id")[: settings.SEARCH_RANKED_POSTS_LIMIT]
+            )
+            # double precision rank survives the cursor round trip exactly
+            queryset = queryset.filter(id__in=recent_matches).annotate(
+                rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+            )
 
-        return queryset.distinct().order_by("-created_at")
+        return queryset.order_by("-created_at")
 
     def get_serializer_class(self):
         if self.action in (
@@ -129,38 +347,117 @@ class PostViewSet(viewsets.ModelViewSet):
             "see_liked_posts",
             "see_my_posts",
             "see_following_users_posts",
+            "see_for_you_posts",
         ):
             return PostListSerializer
         if self.action == "retrieve":
             return PostDetailSerializer
         if self.action == "upload_image":
             return PostImageSerializer
+        if self.action == "see_likers":
+            return UserListSerializer
+        if self.action == "see_comments":
+            return CommentListSerializer
         return PostSerializer
 
+    def _paginated_relation(self, queryset):
+        """Responds with a keyset-paginated page of a post relation"""
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        schedule = serializer.validated_data.get("schedule")
+        is_published = schedule is None or schedule <= timezone.now()
+        post = serializer.save(user=self.request.user, is_published=is_published)
+        attach_extracted_hashtags(post)
+        if is_published:
+            on_posts_published.delay([post.id])
+        if post.image:
+            process_post_image.delay(post.id)
+
+    def perform_update(self, serializer):
+        previous_hashtags = extract_hashtags(
+            serializer.instance.title, serializer.instance.content
+        )
+        # hashtags newly added to a published post count as used for trending
+        retagged = serializer.instance.is_published and (
+            {"title", "content", "hashtags"} & serializer.validated_data.keys()
+        )
+        if retagged:
+            linked_ids = self._linked_hashtag_ids(serializer.instance.id)
+        with transaction.atomic():
+            # locked, publish_scheduled_posts may be publishing the post meanwhile
+            current = (
+                Post.objects.select_for_update()
+                .only("is_published", "created_at")
+                .get(id=serializer.instance.id)
+            )
+            published = {
+                "is_published": current.is_published,
+                "created_at": current.created_at,
+            }
+            schedule = serializer.validated_data.get("schedule")
+            publish = (
+                not current.is_published
+                and "schedule" in serializer.validated_data
+                and (schedule is None or schedule <= timezone.now())
+            )
+            if publish:
+                # an unscheduled or past due post is published now, as on create
+                published = {
+                    "is_published": True,
+                    "created_at": schedule or timezone.now(),
+                }
+            post = serializer.save(**published)
+        if publish:
+            on_posts_published.delay([post.id])
+        if {"title", "content"} & serializer.validated_data.keys():
+            attach_extracted_hashtags(post, previous_hashtags)
+        if retagged:
+            trending.record_hashtags(self._linked_hashtag_ids(post.id) - linked_ids)
+        if serializer.validated_data.get("image"):
+            process_post_image.delay(post.id)
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=self.request.data)
-        schedule = self.request.data.get("schedule")
-        if schedule:
-            time_obj = datetime.datetime.strptime(schedule, "%Y-%m-%dT%H:%M")
-            time_now = timezone.datetime.now()
-            if time_now < time_obj and serializer.is_valid():
-                time_obj = datetime.datetime.strptime(schedule, "%Y-%m-%dT%H:%M")
-                tz = timezone.get_current_timezone()
-                time_aware = timezone.make_aware(time_obj, timezone=tz)
-                data = serializer.data.copy()
-                data["user_id"] = self.request.user.id
-                create_post.apply_async(
-                    args=[data],
-                    eta=time_aware,
-                )
-                return Response(
-                    {"message": "Post scheduled successfully."},
-                    status=status.HTTP_200_OK,
-                )
-        return super().create(request, *args, **kwargs)
+    @staticmethod
+    def _linked_hashtag_ids(post_id):
+        return set(
+            Post.hashtags.through.objects.filter(post_id=post_id).values_list(
+                "hashtag_id", flat=True
+            )
+        )
+
+    @extend_schema(
+        request=PostBulkItemSerializer(many=True),
+        responses={status.HTTP_201_CREATED: OpenApiTypes.OBJECT},
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="bulk",
+        description="create many posts at once, "
+        "responds with created ids and errors of rejected items by index",
+    )
+    def bulk_create(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"detail": "expected a list of posts"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.BULK_POSTS_MAX_ITEMS:
+            return Response(
+                {
+                    "detail": f"at most {settings.BULK_POSTS_MAX_ITEMS} posts per request"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        created, errors = bulk_create_posts(request.user, items)
+        return Response(
+            {"created": created, "errors": errors}, status=status.HTTP_201_CREATED
+        )
 
     @action(
         methods=["POST"],
@@ -174,11 +471,13 @@ class PostViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
+            process_post_image.delay(post.id)
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(responses=PostListSerializer(many=True))
     @action(
         methods=["GET"],
         detail=False,
@@ -186,10 +485,9 @@ class PostViewSet(viewsets.ModelViewSet):
         description="see posts your liked",
     )
     def see_liked_posts(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list(request)
 
+    @extend_schema(responses=PostListSerializer(many=True))
     @action(
         methods=["GET"],
         detail=False,
@@ -197,83 +495,203 @@ class PostViewSet(viewsets.ModelViewSet):
         description="see your posts only",
     )
     def see_my_posts(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list(request)
 
+    @extend_schema(responses=PostListSerializer(many=True))
     @action(
         methods=["GET"],
         detail=False,
         url_path="following",
+        pagination_class=TimelineCursorPagination,
         description="see following users posts",
     )
     def see_following_users_posts(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        if request.query_params.get("q"):
+            return self.list(request)
+
+        # a page of ids from the timeline index, merged with recent posts of
+        # read-time authors, then the posts are loaded by id
+        user = request.user
+        post_ids = self.paginator.paginate_sources(
+            [
+                (
+                    TimelineEntry.objects.filter(user=user).filter(
+                        self._hashtags_filter(prefix="post__")
+                    ),
+                    "post_id",
+                ),
+                (
+                    Post.objects.filter(
+                        is_published=True, user__in=self._read_time_authors(user)
+                    ).filter(self._hashtags_filter()),
+                    "id",
+                ),
+            ],
+            request,
+            view=self,
+        )
+        posts = self.get_queryset().in_bulk(post_ids)
+        serializer = self.get_serializer(
+            [posts[post_id] for post_id in post_ids if post_id in posts], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(responses=PostListSerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="for-you",
+        pagination_class=ScoreCursorPagination,
+        description="see posts ranked by likes, comments, recency and author "
+        "popularity",
+    )
+    def see_for_you_posts(self, request):
+        return self.list(request)
+
+    @extend_schema(responses=UserListSerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="likers",
+        description="see users who liked the post",
+    )
+    def see_likers(self, request, pk=None):
+        post = self.get_object()
+        return self._paginated_relation(
+            get_user_model().objects.filter(liked_posts=post)
+        )
+
+    @extend_schema(responses=CommentListSerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="comments",
+        description="see comments of the post",
+    )
+    def see_comments(self, request, pk=None):
+        post = self.get_object()
+        return self._paginated_relation(post.comments.select_related("user"))
 
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 "hashtags",
                 type={"type": "list", "items": {"type": "number"}},
-                description="Filter by hashtag id (ex. ?hashtags=2,5)",
-            )
+                description="Filter by any of hashtag ids (ex. ?hashtags=2,5)",
+            ),
+            OpenApiParameter(
+                "hashtags_all",
+                type={"type": "list", "items": {"type": "number"}},
+                description="Filter by all of hashtag ids (ex. ?hashtags_all=2,5)",
+            ),
+            OpenApiParameter(
+                "hashtags_exclude",
+                type={"type": "list", "items": {"type": "number"}},
+                description="Exclude posts with any of hashtag ids "
+                "(ex. ?hashtags_exclude=3)",
+            ),
+            OpenApiParameter(
+                "q",
+                type=OpenApiTypes.STR,
+                description="Full-text search in title and content, only the "
+                f"{settings.SEARCH_RANKED_POSTS_LIMIT} most recent matches are "
+                "returned, ordered by relevance; older matches are not reachable, "
+                "narrow the query to find them (ex. ?q=django tips)",
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        if self.action != "list":
+            return super().list(request, *args, **kwargs)
+        return cache.cached_response(
+            cache.post_list_key(request),
+            lambda: super(PostViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cache.cached_response(
+            cache.post_detail_key(kwargs["pk"]),
+            lambda: super(PostViewSet, self).retrieve(request, *args, **kwargs),
+            # scheduled posts are served to their author only
+            cacheable=lambda response: response.data["is_published"],
+        )
+
+
+class CacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
 
+    def get(self, request):
+        """Endpoint to see hit and miss counters of the posts cache"""
+        return Response(cache.get_stats(), status=status.HTTP_200_OK)
 
-class PostToggleLikeView(generics.GenericAPIView):
+
+class DatabaseStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        """Endpoint to see database connections usage and pool saturation"""
+        return Response(db_pool.get_stats(), status=status.HTTP_200_OK)
+
+
+class PostToggleLikeView(RateLimitHeadersMixin, generics.GenericAPIView):
     serializer_class = PostToggleLikeSerializer
     permission_classes = (IsAuthenticated,)
+    throttle_classes = (WriteTokenBucketThrottle,)
+    throttle_scope = "toggle_like"
+    query_budget = 8
 
     def post(self, request, pk=None):
         """Endpoint to like or dislike specific post"""
-        post = Post.objects.get(id=pk)
-        user = self.request.user
-        serializer = self.serializer_class(post, data=request.data)
-
-        if serializer.is_valid():
-            post.toggle_like(user)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        post = get_object_or_404(
+            Post.objects.only("id", "user_id"), id=pk, is_published=True
+        )
+        liked = post.toggle_like(self.request.user)
+        post.refresh_from_db(fields=["likes_count"])
+        serializer = self.get_serializer(
+            {"liked": liked, "likes_count": post.likes_count}
+        )
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class UserToggleFollowView(generics.GenericAPIView):
+class UserToggleFollowView(RateLimitHeadersMixin, generics.GenericAPIView):
     serializer_class = UserFollowSerializer
     permission_classes = (IsAuthenticated,)
+    throttle_classes = (WriteTokenBucketThrottle,)
+    throttle_scope = "toggle_follow"
+    query_budget = 10
 
     def post(self, request, pk=None):
         """Endpoint to follow or unfollow specific user"""
-        following_user = get_user_model().objects.get(id=pk)
+        following_user = get_object_or_404(get_user_model().objects.only("id"), id=pk)
         current_user = self.request.user
         if following_user == current_user:
             return Response(
                 {"detail": "forbidden to follow yourself"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        serializer = self.get_serializer(following_user, data=request.data)
-
-        if serializer.is_valid():
-            following_user.toggle_follow(current_user)
-            serializer.save()
-
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        following = following_user.toggle_follow(current_user)
+        sync_follow_timeline.delay(current_user.id, following_user.id, following)
+        following_user.refresh_from_db(fields=["followers_count"])
+        serializer = self.get_serializer(
+            {"following": following, "followers_count": following_user.followers_count}
+        )
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class AddCommentView(generics.GenericAPIView):
+class AddCommentView(RateLimitHeadersMixin, generics.GenericAPIView):
     serializer_class = CommentSerializer
     permission_classes = (IsAuthenticated,)
+    throttle_classes = (WriteTokenBucketThrottle,)
+    throttle_scope = "comment"
+    query_budget = 8
 
     def post(self, request, pk=None):
         """Endpoint to add comment to specific post"""
-        post = Post.objects.get(id=pk)
+        post = get_object_or_404(
+            Post.objects.only("id", "user_id"), id=pk, is_published=True
+        )
         user = self.request.user
         serializer = self.get_serializer(data=self.request.data)
 
@@ -288,6 +706,23 @@ class AddCommentView(generics.GenericAPIView):
 class ManageCommentView(generics.RetrieveUpdateDestroyAPIView):
     """Endpoint to edit or delete specific comment"""
 
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related("user", "post__user").prefetch_related(
+        "post__hashtags"
+    )
     serializer_class = CommentDetailSerializer
     permission_classes = (IsAuthenticated, IsOwnerOrReadOnly)
+    query_budget = 4
+
+
+class NotificationListView(generics.ListAPIView):
+    """Endpoint to see likes, follows and comments of the user, collapsed"""
+
+    serializer_class = NotificationSerializer
+    permission_classes = (IsAuthenticated,)
+    query_budget = 2
+    pagination_class = NotificationCursorPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(
+            recipient=self.request.user, actors_count__gt=0
+        ).select_related("last_actor")
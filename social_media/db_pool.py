@@ -0,0 +1,75 @@
+"""Bounded database worker threads and connection saturation metrics.
+
+Every thread holds its own Django connection, so queries run off the request
+thread (see network.async_views.gather_querysets) go through query_executor,
+which caps connections opened by a process at DB_QUERY_WORKERS.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+query_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_QUERY_WORKERS, thread_name_prefix="db-query"
+)
+
+_busy_lock = threading.Lock()
+_busy_workers = 0
+
+
+def track_busy(func):
+    """Counts query workers running func, reported by get_stats"""
+
+    def wrapper(*args, **kwargs):
+        global _busy_workers
+        with _busy_lock:
+            _busy_workers += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with _busy_lock:
+                _busy_workers -= 1
+
+    return wrapper
+
+
+CONNECTIONS_SQL = """
+SELECT coalesce(state, 'unknown'), count(*)
+FROM pg_stat_activity
+WHERE datname = current_database() AND backend_type = 'client backend'
+GROUP BY 1
+"""
+
+
+def _database_stats(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SHOW max_connections")
+            max_connections = int(cursor.fetchone()[0])
+            cursor.execute(CONNECTIONS_SQL)
+            by_state = dict(cursor.fetchall())
+    except DatabaseError as error:
+        # an unreachable replica must not hide stats of the other databases
+        return {"error": str(error)}
+    total = sum(by_state.values())
+    return {
+        "connections": total,
+        "max_connections": max_connections,
+        "saturation": total / max_connections,
+        "by_state": by_state,
+    }
+
+
+def get_stats():
+    """Connection usage of every database and query workers of this process"""
+    return {
+        "pool_mode": settings.DB_POOL_MODE,
+        "conn_max_age": connections["default"].settings_dict["CONN_MAX_AGE"],
+        "query_workers": {
+            "busy": _busy_workers,
+            "max": settings.DB_QUERY_WORKERS,
+            "saturation": _busy_workers / settings.DB_QUERY_WORKERS,
+        },
+        "databases": {alias: _database_stats(alias) for alias in settings.DATABASES},
+    }
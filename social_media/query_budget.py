@@ -0,0 +1,169 @@
+"""Per-request SQL instrumentation.
+
+QueryBudgetMiddleware counts queries and database time of every request,
+including queries run on worker threads, and reports them per view and action:
+one JSON log record per request and, with QUERY_SERVER_TIMING on, a
+Server-Timing header. A statement repeated
+QUERY_REPEAT_THRESHOLD times is reported as a likely N+1. Views declare their
+budget with `query_budget`, an int or a dict by viewset action:
+
+    class PostViewSet(viewsets.ModelViewSet):
+        query_budget = {"list": 4, "retrieve": 5}
+
+Requests over budget are logged as warnings, or raise QueryBudgetExceeded when
+QUERY_BUDGET_RAISE is on, which is meant for tests.
+"""
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_current_stats = contextvars.ContextVar("query_stats", default=None)
+
+# "IN (%s, %s, %s)" of any length is the same statement
+_PLACEHOLDERS_RE = re.compile(r"%s(?:, %s)+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, sql, duration):
+        fingerprint = _PLACEHOLDERS_RE.sub("%s, ...", sql)
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.fingerprints[fingerprint] += 1
+
+    def repeated(self):
+        return [
+            {"sql": fingerprint[:300], "count": count}
+            for fingerprint, count in self.fingerprints.most_common()
+            if count >= settings.QUERY_REPEAT_THRESHOLD
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _view_name_and_budget(request):
+    match = request.resolver_match
+    if match is None:
+        return None, None, None
+    view = match.func
+    view_class = getattr(view, "cls", None) or getattr(view, "view_class", None)
+    if view_class is None:
+        return match.view_name, None, None
+
+    action = getattr(view, "actions", {}).get(request.method.lower())
+    if action is None:
+        # views serving one action, by as_view(action=...) or a class attribute
+        action = getattr(view, "view_initkwargs", {}).get("action") or getattr(
+            view_class, "action", None
+        )
+    budget = getattr(view_class, "query_budget", None)
+    if isinstance(budget, dict):
+        budget = budget.get(action)
+    return f"{view_class.__module__}.{view_class.__name__}", action, budget
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(sender=None, connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self._report(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self._report(request, response, stats, time.perf_counter() - started)
+
+    @staticmethod
+    def _report(request, response, stats, duration):
+        db_ms = stats.duration * 1000
+        if settings.QUERY_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={db_ms:.1f};desc="{stats.count} queries", '
+                f"total;dur={duration * 1000:.1f}"
+            )
+
+        view, action, budget = _view_name_and_budget(request)
+        if view is None:
+            return response
+        repeated = stats.repeated()
+        over_budget = budget is not None and stats.count > budget
+        record = {
+            "view": view,
+            "action": action,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": stats.count,
+            "query_budget": budget,
+            "db_ms": round(db_ms, 2),
+            "total_ms": round(duration * 1000, 2),
+            "repeated": repeated,
+        }
+        logger.log(
+            logging.WARNING if over_budget or repeated else logging.INFO,
+            json.dumps(record),
+        )
+        if over_budget and settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(
+                f"{view} {action or request.method} ran {stats.count} queries, "
+                f"budget is {budget}"
+            )
+        return response
@@ -0,0 +1,184 @@
+"""Routing of API reads to Postgres read replicas.
+
+ReplicaRoutingMiddleware binds the current request, ReplicaRouter sends reads of
+safe requests to network and user views to a replica. A user who has just written
+is pinned to the primary for READ_YOUR_WRITES_SECONDS, so their own changes are
+visible at once, and replicas lagging behind more than REPLICA_MAX_LAG_SECONDS
+are skipped. Reads filling caches shared with other requests go to the primary,
+see reading_from_primary.
+"""
+import contextlib
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+REPLICA_APPS = ("network", "user")
+
+# streaming replica catching up with received WAL is lagging for that long
+LAG_SQL = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+    )
+END
+"""
+
+_current_request = contextvars.ContextVar("replica_routing_request", default=None)
+_primary_reads = contextvars.ContextVar("replica_routing_primary", default=False)
+# replica alias -> (monotonic time of the check, is healthy)
+_replica_health = {}
+
+
+def _pin_key(user_id):
+    return f"db:primary:{user_id}"
+
+
+def _token_user_id(request):
+    """User id from the JWT of the request, validated without a database query"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    return token.get(jwt_settings.USER_ID_CLAIM)
+
+
+def _is_healthy(alias):
+    checked_at, healthy = _replica_health.get(alias, (None, False))
+    if (
+        checked_at is not None
+        and time.monotonic() - checked_at < settings.REPLICA_LAG_CHECK_SECONDS
+    ):
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            healthy = cursor.fetchone()[0] <= settings.REPLICA_MAX_LAG_SECONDS
+    except DatabaseError:
+        healthy = False
+    _replica_health[alias] = (time.monotonic(), healthy)
+    return healthy
+
+
+@contextlib.contextmanager
+def reading_from_primary():
+    """Routes reads in the block to the primary.
+
+    For data outliving the request, like cached responses: a lagging replica
+    would store data older than writes the cache was invalidated for.
+    """
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class _RoutedRequest:
+    """Routing decision of one request, made on its first read"""
+
+    def __init__(self, request):
+        self.request = request
+        self._alias = None
+
+    def _is_pinned(self):
+        user_id = _token_user_id(self.request)
+        return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+    def alias(self):
+        if self._alias is None:
+            match = self.request.resolver_match
+            if match is None:
+                # urls are not resolved yet, decide on a later read
+                return "default"
+            self._alias = "default"
+            if (
+                self.request.method in SAFE_METHODS
+                and match.app_name in REPLICA_APPS
+                and not self._is_pinned()
+            ):
+                healthy = [
+                    alias for alias in settings.REPLICA_DATABASES if _is_healthy(alias)
+                ]
+                if healthy:
+                    # one replica per request, pages and counters see one snapshot
+                    self._alias = random.choice(healthy)
+        return self._alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        routed = _current_request.get()
+        if routed is None or not settings.REPLICA_DATABASES or _primary_reads.get():
+            return "default"
+        return routed.alias()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaRoutingMiddleware:
+    """Binds the request for ReplicaRouter and pins writers to the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(_RoutedRequest(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        self._pin_writer(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _current_request.set(_RoutedRequest(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        await sync_to_async(self._pin_writer)(request, response)
+        return response
+
+    @staticmethod
+    def _pin_writer(request, response):
+        if (
+            not settings.REPLICA_DATABASES
+            or request.method in SAFE_METHODS
+            or response.status_code >= 400
+        ):
+            return
+        user_id = _token_user_id(request)
+        if user_id is not None:
+            cache.set(_pin_key(user_id), 1, settings.READ_YOUR_WRITES_SECONDS)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "user",
     "rest_framework_simplejwt.token_blacklist",
@@ -55,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "social_media.query_budget.QueryBudgetMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -62,6 +65,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "social_media.replicas.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "social_media.urls"
@@ -84,10 +88,24 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "social_media.wsgi.application"
 
+# Serve posts list, following, liked, my and detail with async views,
+# enable when the app runs under an ASGI server
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "False") == "True"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connection handling:
+# "persistent" - WSGI workers and Celery tasks reuse one connection per thread
+# for DB_CONN_MAX_AGE seconds, checked before reuse.
+# "pgbouncer" - a connection per request to PgBouncer in transaction pooling
+# mode, which bounds server connections. Use it for ASGI, where request threads
+# are short-lived and can't keep persistent connections.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "persistent")
+if DB_POOL_MODE not in ("persistent", "pgbouncer"):
+    raise ImproperlyConfigured(f"Unknown DB_POOL_MODE {DB_POOL_MODE!r}")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -96,9 +114,78 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        "CONN_MAX_AGE": (
+            int(os.getenv("DB_CONN_MAX_AGE", "60"))
+            if DB_POOL_MODE == "persistent"
+            else 0
+        ),
+        "CONN_HEALTH_CHECKS": True,
+        # server-side cursors don't survive transaction pooling
+        "DISABLE_SERVER_SIDE_CURSORS": DB_POOL_MODE == "pgbouncer",
     }
 }
 
+# Threads running queries concurrently for async views, per process
+DB_QUERY_WORKERS = int(os.getenv("DB_QUERY_WORKERS", "8"))
+
+# Query budget middleware: statements repeated that many times in one request
+# are reported as N+1, going over a view's query_budget raises when enabled,
+# QUERY_SERVER_TIMING sends the counts to clients in a Server-Timing header
+QUERY_REPEAT_THRESHOLD = 5
+QUERY_BUDGET_RAISE = os.getenv("QUERY_BUDGET_RAISE", "False") == "True"
+QUERY_SERVER_TIMING = True
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        # one JSON record per request with its queries
+        "social_media.query_budget": {
+            "handlers": ["console"],
+            "level": os.getenv("QUERY_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
+# Read replicas of the default database, comma separated hosts.
+# Reads of safe requests to network and user views are routed to them
+REPLICA_DATABASES = []
+for index, host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(","))
+):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["social_media.replicas.ReplicaRouter"]
+
+# Seconds a user reads from the primary after a write
+READ_YOUR_WRITES_SECONDS = 5
+# Replicas lagging behind more are skipped until the next check
+REPLICA_MAX_LAG_SECONDS = 2
+REPLICA_LAG_CHECK_SECONDS = 5
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"{REDIS_URL}/1",
+    }
+}
+
+# Seconds a cached post detail or posts list page lives without invalidation
+POSTS_CACHE_TIMEOUT = 5 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -141,6 +228,12 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 MEDIA_URL = "/media/"
 
+# Widths of WebP and JPEG copies generated for uploaded post and user images
+IMAGE_RENDITION_WIDTHS = (160, 480, 1080)
+IMAGE_RENDITION_QUALITY = 80
+# Quality of JPEG and WebP originals re-encoded without metadata
+IMAGE_ORIGINAL_QUALITY = 95
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -151,8 +244,32 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "network.pagination.IdCursorPagination",
+    "PAGE_SIZE": 20,
+    # token buckets of network.throttling: capacity/refill period
+    "DEFAULT_THROTTLE_RATES": {
+        "toggle_like": "60/min",
+        "toggle_follow": "30/min",
+        "comment": "20/min",
+        "register": "5/hour",
+        "writes": "120/min",
+    },
 }
 
+# Amount of most recent posts matching a search that are ordered by relevance
+SEARCH_RANKED_POSTS_LIMIT = 1000
+
+# Amount of likers, comments and followers embedded into detail responses
+RELATION_PREVIEW_SIZE = 10
+
+# Ranked feed: positive weights of score terms, every term halves each half-life.
+# The author term is per ln(1 + followers of the author)
+RANKING_POST_WEIGHT = 1.0
+RANKING_AUTHOR_WEIGHT = 0.5
+RANKING_LIKE_WEIGHT = 1.0
+RANKING_COMMENT_WEIGHT = 3.0
+RANKING_HALF_LIFE_SECONDS = 6 * 60 * 60
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Social Media API",
     "DESCRIPTION": "Api for basic social media app",
@@ -161,8 +278,60 @@ SPECTACULAR_SETTINGS = {
 }
 
 
-CELERY_BROKER_URL = "redis://localhost:6379"
-CELERY_RESULT_BACKEND = "redis://localhost:6379"
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_TIMEZONE = "Europe/Kyiv"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_BEAT_SCHEDULE = {
+    "publish-scheduled-posts": {
+        "task": "network.tasks.publish_scheduled_posts",
+        "schedule": 30.0,
+    },
+    "drain-activity-outbox": {
+        "task": "network.tasks.drain_activity_outbox",
+        "schedule": 5.0,
+    },
+    "compute-follow-suggestions": {
+        "task": "network.tasks.compute_follow_suggestions",
+        "schedule": 24 * 60 * 60.0,
+    },
+}
+
+SCHEDULED_POSTS_BATCH_SIZE = 500
+
+# Activity events moved from the outbox to the activity log per transaction
+ACTIVITY_OUTBOX_BATCH_SIZE = 1000
+
+# Trending hashtags: usage is counted per bucket in Redis sorted sets and
+# summed over the sliding window on read
+TRENDING_REDIS_URL = f"{REDIS_URL}/2"
+TRENDING_WINDOW_SECONDS = 24 * 60 * 60
+TRENDING_BUCKET_SECONDS = 60 * 60
+TRENDING_CACHE_SECONDS = 60
+
+# Redis database of token buckets of write endpoints throttling
+THROTTLE_REDIS_URL = f"{REDIS_URL}/3"
+
+# Follow graph adjacency sets, expiry bounds drift of a set loaded during a toggle
+FOLLOW_GRAPH_REDIS_URL = f"{REDIS_URL}/4"
+FOLLOW_GRAPH_TTL_SECONDS = 24 * 60 * 60
+
+# "People you may know", computed by a periodic task in shards of users
+SUGGESTIONS_PER_USER = 20
+SUGGESTIONS_BATCH_SIZE = 1000
+SUGGESTIONS_SHARD_SIZE = 5000
+SUGGESTIONS_SHARD_TIME_LIMIT = 10 * 60
+SUGGESTIONS_CO_LIKE_WEIGHT = 0.5
+# likes of posts more popular than that are ignored
+SUGGESTIONS_MAX_POST_LIKERS = 1000
+
+# Bulk post creation: items accepted per request and rows per INSERT
+BULK_POSTS_MAX_ITEMS = 1000
+BULK_POSTS_BATCH_SIZE = 500
+
+# Home timeline fan-out
+# Posts of users with more followers than the limit are merged on read
+TIMELINE_FANOUT_FOLLOWERS_LIMIT = 10_000
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 50
@@ -0,0 +1,68 @@
+"""
+Production settings, selected with DJANGO_SETTINGS_MODULE=social_media.settings_prod
+
+Extends the development settings: no debug toolbar, no SQL recording and no
+Server-Timing header, cached template loaders, gzip and conditional GET, JSON
+only responses.
+"""
+import os
+
+from social_media.settings import *  # noqa: F401, F403
+from social_media.settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+# DEBUG off also stops recording every query in connection.queries
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.getenv("ALLOWED_HOSTS", "").split(",") if host]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "debug_toolbar"]
+
+# query counts and database time are only logged, not exposed to clients
+QUERY_SERVER_TIMING = False
+
+MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "social_media.query_budget.QueryBudgetMiddleware",
+    "django.middleware.gzip.GZipMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
+    *(
+        middleware
+        for middleware in MIDDLEWARE
+        if middleware
+        not in (
+            "django.middleware.security.SecurityMiddleware",
+            "social_media.query_budget.QueryBudgetMiddleware",
+            "debug_toolbar.middleware.DebugToolbarMiddleware",
+        )
+    ),
+]
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        "APP_DIRS": False,
+        "OPTIONS": {
+            "context_processors": [
+                processor
+                for processor in TEMPLATES[0]["OPTIONS"]["context_processors"]
+                if processor != "django.template.context_processors.debug"
+            ],
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                )
+            ],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    # no browsable API, responses are rendered as compact JSON
+    "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
+    "COMPACT_JSON": True,
+}
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+UPDATE user_user SET
+    followers_count = (
+        SELECT count(*) FROM user_user_followed_by
+        WHERE user_user_followed_by.from_user_id = user_user.id
+    ),
+    following_count = (
+        SELECT count(*) FROM user_user_followed_by
+        WHERE user_user_followed_by.to_user_id = user_user.id
+    );
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0005_user_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="followers_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -3,7 +3,11 @@ import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, When
+from django.db.models.functions import Upper
+from django.db.models.signals import m2m_changed
 from django.utils.translation import gettext as _
 
 
@@ -55,16 +59,38 @@ class User(AbstractUser):
     username = None
     email = models.EmailField(_("email address"), unique=True)
     image = models.ImageField(null=True, upload_to=user_image_file_path, blank=True)
+    # resized copies of image, filled in by the process_user_image task
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     followed_by = models.ManyToManyField(
         settings.AUTH_USER_MODEL, blank=True, related_name="users"
     )
+    # denormalized sizes of followed_by and users, kept in step by toggle_follow
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        # trigram indexes on UPPER() serve both icontains filters and fuzzy search
+        indexes = [
+            GinIndex(
+                OpClass(Upper("email"), name="gin_trgm_ops"),
+                name="user_email_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("first_name"), name="gin_trgm_ops"),
+                name="user_first_name_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("last_name"), name="gin_trgm_ops"),
+                name="user_last_name_trgm_idx",
+            ),
+        ]
+
     @property
     def full_name(self) -> str:
         return self.get_full_name()
@@ -75,9 +101,56 @@ class User(AbstractUser):
             user += ", Full name:" + self.get_full_name()
         return user
 
-    def toggle_follow(self, user) -> None:
-        """Switch following parameter for user"""
-        if user in self.followed_by.all():
-            self.followed_by.remove(user)
-        else:
-            self.followed_by.add(user)
+    @classmethod
+    def shift_follow_counters(cls, followed_id, follower_id, delta):
+        """Atomically shifts followers_count of the followed user and
+        following_count of the follower by delta.
+
+        One UPDATE locks both rows in the same order for every pair of users, so
+        users following each other at the same time can't deadlock.
+        """
+        cls.objects.filter(id__in=(followed_id, follower_id)).update(
+            followers_count=Case(
+                When(id=followed_id, then=F("followers_count") + delta),
+                default=F("followers_count"),
+                output_field=models.PositiveIntegerField(),
+            ),
+            following_count=Case(
+                When(id=follower_id, then=F("following_count") + delta),
+                default=F("following_count"),
+                output_field=models.PositiveIntegerField(),
+            ),
+        )
+
+    def toggle_follow(self, user) -> bool:
+        """Switch following parameter for user, return True if user now follows
+
+        Works on the single (self, user) row of the through table, so the cost
+        does not depend on the amount of followers.
+        """
+        follow = User.followed_by.through
+        with transaction.atomic():
+            removed, _ = follow.objects.filter(
+                from_user_id=self.id, to_user_id=user.id
+            ).delete()
+            if removed:
+                following = False
+            else:
+                try:
+                    with transaction.atomic():
+                        follow.objects.create(from_user_id=self.id, to_user_id=user.id)
+                except IntegrityError:
+                    # concurrent request of the same user has already followed
+                    return True
+                following = True
+            self.shift_follow_counters(self.id, user.id, 1 if following else -1)
+            m2m_changed.send(
+                sender=follow,
+                instance=self,
+                action="post_add" if following else "post_remove",
+                reverse=False,
+                model=User,
+                pk_set={user.id},
+                using=self._state.db,
+            )
+        return following
@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from network.serializers import ImageSrcsetField, ProcessedImageField
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,15 +32,19 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserFollowersSerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = get_user_model()
-        fields = ("id", "email", "full_name", "is_staff", "image")
-        read_only_fields = ("id", "email", "full_name", "is_staff", "image")
+        fields = ("id", "email", "full_name", "is_staff", "image_srcset")
+        read_only_fields = ("id", "email", "full_name", "is_staff")
 
 
 class MyDetailSerializer(UserSerializer):
-    followers = UserFollowersSerializer(source="followed_by", many=True, read_only=True)
-    following = UserFollowersSerializer(source="users", many=True, read_only=True)
+    image = ProcessedImageField()
+    image_srcset = ImageSrcsetField()
+    followers = serializers.SerializerMethodField()
+    following = serializers.SerializerMethodField()
 
     class Meta:
         model = get_user_model()
@@ -48,18 +56,36 @@ class MyDetailSerializer(UserSerializer):
             "last_name",
             "is_staff",
             "image",
+            "image_srcset",
             "bio",
+            "followers_count",
             "followers",
+            "following_count",
             "following",
         )
         read_only_fields = ("is_staff",)
         extra_kwargs = {"password": {"write_only": True, "min_length": 5}}
 
+    @extend_schema_field(UserFollowersSerializer(many=True))
+    def get_followers(self, user):
+        """First page of followers, the rest is served by /me/followers/"""
+        followers = user.followed_by.order_by("id")[: settings.RELATION_PREVIEW_SIZE]
+        return UserFollowersSerializer(followers, many=True, context=self.context).data
+
+    @extend_schema_field(UserFollowersSerializer(many=True))
+    def get_following(self, user):
+        """First page of followed users, the rest is served by /me/following/"""
+        following = user.users.order_by("id")[: settings.RELATION_PREVIEW_SIZE]
+        return UserFollowersSerializer(following, many=True, context=self.context).data
+
 
 class UserImageSerializer(serializers.ModelSerializer):
+    image = ProcessedImageField()
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = get_user_model()
-        fields = ("id", "image")
+        fields = ("id", "image", "image_srcset")
 
 
 class LogoutSerializer(serializers.Serializer):
@@ -1,3 +1,76 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from rest_framework.throttling import SimpleRateThrottle
+
+from network.tests import NetworkAPITestCase, create_user
+
+
+class MeTests(NetworkAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user("me@example.com")
+        self.followers = [
+            create_user(f"follower{index}@example.com") for index in range(3)
+        ]
+        for follower in self.followers:
+            self.user.toggle_follow(follower)
+        self.followers[0].toggle_follow(self.user)
+        self.login(self.user)
+
+    def emails(self, users):
+        return [user["email"] for user in users]
+
+    def test_counts_and_previews(self):
+        with self.settings(RELATION_PREVIEW_SIZE=2):
+            response = self.client.get("/api/user/me/")
+
+        self.assertEqual(response.data["followers_count"], 3)
+        self.assertEqual(response.data["following_count"], 1)
+        self.assertEqual(
+            self.emails(response.data["followers"]),
+            ["follower0@example.com", "follower1@example.com"],
+        )
+        self.assertEqual(
+            self.emails(response.data["following"]), ["follower0@example.com"]
+        )
+
+    def test_followers_and_following(self):
+        followers = self.client.get("/api/user/me/followers/").data["results"]
+        following = self.client.get("/api/user/me/following/").data["results"]
+
+        self.assertEqual(
+            sorted(self.emails(followers)),
+            [follower.email for follower in self.followers],
+        )
+        self.assertEqual(self.emails(following), ["follower0@example.com"])
+
+    def test_unfollow_updates_counts(self):
+        self.client.post(f"/api/network/users/{self.followers[0].id}/toggle-follow/")
+
+        response = self.client.get("/api/user/me/")
+        self.assertEqual(response.data["following_count"], 0)
+        self.assertEqual(response.data["following"], [])
+
+
+class RegisterTests(NetworkAPITestCase):
+    def register(self, email):
+        return self.client.post(
+            "/api/user/register/", {"email": email, "password": "password"}
+        )
+
+    def test_register_and_obtain_token(self):
+        self.assertEqual(self.register("new@example.com").status_code, 201)
+        response = self.client.post(
+            "/api/user/token/", {"email": "new@example.com", "password": "password"}
+        )
+        self.assertIn("access", response.data)
+
+    def test_registrations_of_an_address_are_throttled(self):
+        rates = {**SimpleRateThrottle.THROTTLE_RATES, "register": "1/hour"}
+        with mock.patch.object(SimpleRateThrottle, "THROTTLE_RATES", rates):
+            first = self.register("first@example.com")
+            second = self.register("second@example.com")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second["RateLimit-Remaining"], "0")
@@ -5,7 +5,14 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
-from user.views import UserCreateView, UserManageView, LogoutView, UploadMyImageView
+from user.views import (
+    UserCreateView,
+    UserManageView,
+    LogoutView,
+    UploadMyImageView,
+    MyFollowersView,
+    MyFollowingView,
+)
 
 urlpatterns = [
     path("register/", UserCreateView.as_view(), name="create_user"),
@@ -14,6 +21,8 @@ urlpatterns = [
     path("me/", UserManageView.as_view(), name="manage_user"),
     path("logout/", LogoutView.as_view(), name="auth_logout"),
     path("me/upload-image/", UploadMyImageView.as_view(), name="upload_my_image"),
+    path("me/followers/", MyFollowersView.as_view(), name="my_followers"),
+    path("me/following/", MyFollowingView.as_view(), name="my_following"),
 ]
 
 app_name = "user"
@@ -1,31 +1,61 @@
-from django.contrib.auth import get_user_model
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from network.tasks import process_user_image
+from network.throttling import (
+    RateLimitHeadersMixin,
+    WriteTokenBucketThrottle,
+)
 from user.serializers import (
     UserSerializer,
     LogoutSerializer,
     UserImageSerializer,
     MyDetailSerializer,
+    UserFollowersSerializer,
 )
 
 
-class UserCreateView(generics.CreateAPIView):
+class UserCreateView(RateLimitHeadersMixin, generics.CreateAPIView):
     serializer_class = UserSerializer
+    throttle_classes = (WriteTokenBucketThrottle,)
+    throttle_scope = "register"
 
 
 class UserManageView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MyDetailSerializer
     permission_classes = (IsAuthenticated,)
+    query_budget = 5
 
     def get_object(self):
-        user = self.request.user
-        return (
-            get_user_model()
-            .objects.prefetch_related("followed_by", "users")
-            .get(id=user.id)
-        )
+        return self.request.user
+
+    def perform_update(self, serializer):
+        user = serializer.save()
+        if serializer.validated_data.get("image"):
+            process_user_image.delay(user.id)
+
+
+class MyFollowersView(generics.ListAPIView):
+    """Endpoint to list users who follow you"""
+
+    serializer_class = UserFollowersSerializer
+    permission_classes = (IsAuthenticated,)
+    query_budget = 2
+
+    def get_queryset(self):
+        return self.request.user.followed_by.all()
+
+
+class MyFollowingView(generics.ListAPIView):
+    """Endpoint to list users you follow"""
+
+    serializer_class = UserFollowersSerializer
+    permission_classes = (IsAuthenticated,)
+    query_budget = 2
+
+    def get_queryset(self):
+        return self.request.user.users.all()
 
 
 class UploadMyImageView(generics.GenericAPIView):
@@ -38,7 +68,8 @@ class UploadMyImageView(generics.GenericAPIView):
 
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            process_user_image.delay(user.id)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 